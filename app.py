@@ -1,27 +1,356 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+import click
+from flask import (
+    Blueprint, Flask, current_app, render_template, request, redirect, url_for, session, flash,
+    jsonify, g, Response, stream_with_context
+)
 import sqlite3
 from werkzeug.security import generate_password_hash, check_password_hash
-import requests
-import math
-from datetime import date
+import bisect
+import csv
+import functools
+import hmac
+import io
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from datetime import date, timedelta
 
-app = Flask(__name__)
-app.secret_key = 'A1AutoCareSecretKey'
+# requests and numpy are imported where they are used, so importing this
+# module (every worker boot, CLI call and test) stays fast.
+
+# -----------------------------
+# APP SETUP
+# -----------------------------
+# Settings live in DEFAULT_CONFIG next to the code that reads them;
+# create_app() (bottom of this file) applies them plus any overrides.
+# Routes and CLI commands are registered on the `main` blueprint.
+DEFAULT_CONFIG = {
+    "SECRET_KEY": "A1AutoCareSecretKey",
+}
+
+bp = Blueprint("main", __name__, cli_group=None)
+
+BOOKING_STATUSES = ("PENDING", "CONFIRMED", "IN PROGRESS", "COMPLETED", "CANCELLED")
 
 # -----------------------------
 # BRANCH DATA
 # -----------------------------
-BRANCHES = [
-    {"name": "Milton Keynes", "lat": 52.0406, "lon": -0.7594},
-    {"name": "Wembley", "lat": 51.5530, "lon": -0.2960},
-    {"name": "Luton", "lat": 51.8787, "lon": -0.4200},
-]
+# Branches live in the branches table (migration 5, seeded with the original
+# three). opens/closes are HH:MM, slot_minutes is the length of one booking
+# slot, bays is how many cars can be worked on at once and closed_days uses
+# date.weekday() numbering (Monday is 0). See get_branches().
+
+# -----------------------------
+# METRICS
+# -----------------------------
+# In-process counters and histograms, rendered in Prometheus text format at
+# /admin/metrics. Each observation is a bisect and a few additions under a
+# lock, cheap enough to leave on in production. Counts are per process, so
+# scrape every worker (or sum them) when running several.
+DEFAULT_CONFIG["SLOW_QUERY_MS"] = 100
+DEFAULT_CONFIG["METRICS_TOKEN"] = None   # lets a scraper authenticate without a session
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+    def __init__(self, name, kind, help_text, buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.buckets = buckets
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(labels, value if self.kind == "counter" else ([*value[0]], value[1], value[2]))
+                     for labels, value in self.series.items()]
+
+        for labels, value in items:
+            label_text = ",".join(f'{n}="{_escape_label(v)}"' for n, v in zip(label_names, labels))
+            if self.kind == "counter":
+                lines.append(f"{self.name}{{{label_text}}} {value}")
+                continue
+
+            counts, total, count = value
+            cumulative = 0
+            sep = "," if label_text else ""
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# name -> (metric, label names)
+METRICS = {
+    "request": (Metric("a1_request_duration_seconds", "histogram",
+                       "Time spent handling a request, by route.", LATENCY_BUCKETS),
+                ("endpoint", "method", "status")),
+    "sql": (Metric("a1_sql_duration_seconds", "histogram",
+                   "SQLite statement execution time, by statement fingerprint.", LATENCY_BUCKETS),
+            ("statement",)),
+    "sql_rows": (Metric("a1_sql_rows_total", "counter",
+                        "Rows returned (SELECT) or changed (DML), by statement fingerprint."),
+                 ("statement",)),
+    "sql_slow": (Metric("a1_sql_slow_queries_total", "counter",
+                        "Statements slower than SLOW_QUERY_MS."),
+                 ("statement",)),
+    "sql_lock_wait": (Metric("a1_sql_lock_wait_seconds", "histogram",
+                             "Time BEGIN IMMEDIATE waited for the SQLite write lock.", LATENCY_BUCKETS),
+                      ()),
+    "geocode": (Metric("a1_geocode_upstream_duration_seconds", "histogram",
+                       "postcodes.io request time.", LATENCY_BUCKETS),
+                ("call", "outcome")),
+}
+
+def render_metrics():
+    lines = []
+    for metric, label_names in METRICS.values():
+        lines.extend(metric.render(label_names))
+
+    lines.append("# HELP a1_geocode_events_total Geocoder cache and upstream events.")
+    lines.append("# TYPE a1_geocode_events_total counter")
+    for event, value in sorted(geocode_stats().items()):
+        lines.append(f'a1_geocode_events_total{{event="{event}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+def _record_request_time(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        METRICS["request"][0].observe(
+            time.perf_counter() - started,
+            (request.endpoint or "unmatched", request.method, str(response.status_code))
+        )
+    return response
+
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+@functools.lru_cache(maxsize=1024)
+def sql_fingerprint(sql):
+    """Collapse whitespace, literals and IN lists so similar statements share a series."""
+    sql = " ".join(sql.split())
+    sql = _SQL_LITERALS.sub("?", sql)
+    return _SQL_IN_LIST.sub("(...)", sql)
+
+_TRANSACTION_CONTROL = {"BEGIN", "COMMIT", "END", "ROLLBACK", "SAVEPOINT", "RELEASE"}
+
+def record_sql(sql, duration, rows, slow_query_ms=None):
+    fingerprint = (sql_fingerprint(sql),)
+    METRICS["sql"][0].observe(duration, fingerprint)
+    if rows > 0:
+        METRICS["sql_rows"][0].inc(fingerprint, rows)
+
+    # BEGIN IMMEDIATE spends its time queued behind other writers and COMMIT
+    # spends it writing the WAL; neither says anything about the query plan,
+    # so lock waits get their own histogram and stay out of the slow log.
+    keyword = fingerprint[0].split(" ", 1)[0].upper()
+    if keyword in _TRANSACTION_CONTROL:
+        if keyword == "BEGIN":
+            METRICS["sql_lock_wait"][0].observe(duration)
+        return
+    if slow_query_ms is None:
+        slow_query_ms = current_app.config["SLOW_QUERY_MS"]
+    if duration * 1000 >= slow_query_ms:
+        METRICS["sql_slow"][0].inc(fingerprint)
+        current_app.logger.warning("Slow query (%.1f ms): %s", duration * 1000, fingerprint[0])
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Times every execute and counts the rows fetched. Rows are tallied on the
+    cursor and recorded once, when it is exhausted, closed, re-executed or
+    garbage collected, so iterating a result doesn't take the metric lock per row.
+    """
+    _statement = None
+    _fetched = 0
+
+    def _record_fetched(self):
+        if self._fetched:
+            METRICS["sql_rows"][0].inc((sql_fingerprint(self._statement),), self._fetched)
+            self._fetched = 0
+
+    def execute(self, sql, parameters=()):
+        self._record_fetched()
+        self._statement = sql
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_sql(sql, time.perf_counter() - start, max(self.rowcount, 0), self.connection.slow_query_ms)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._record_fetched()
+        self._statement = sql
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_sql(sql, time.perf_counter() - start, max(self.rowcount, 0), self.connection.slow_query_ms)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is None:
+            self._record_fetched()
+        else:
+            self._fetched += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = super().fetchmany(size)
+        self._fetched += len(rows)
+        if len(rows) < size:
+            self._record_fetched()
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._fetched += len(rows)
+        self._record_fetched()
+        return rows
+
+    def __next__(self):
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._record_fetched()
+            raise
+        self._fetched += 1
+        return row
+
+    def close(self):
+        self._record_fetched()
+        super().close()
+
+    def __del__(self):
+        self._record_fetched()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Copied from the config by connect_db(); reading current_app.config on
+    # every statement costs more than the statement itself for point queries.
+    slow_query_ms = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+# -----------------------------
+# DATABASE CONNECTIONS
+# -----------------------------
+# Each request borrows one connection (stored on `g`) from a small pool and
+# hands it back on teardown. Connections run in autocommit mode; writes go
+# through `transaction()`, which takes the write lock up front so concurrent
+# writers wait on busy_timeout instead of failing with "database is locked".
+DEFAULT_CONFIG["DATABASE"] = "database.db"
+DEFAULT_CONFIG["DB_POOL_SIZE"] = 8
+DEFAULT_CONFIG["DB_BUSY_TIMEOUT"] = 5000     # milliseconds
+DEFAULT_CONFIG["DB_STATEMENT_CACHE"] = 256   # prepared statements per connection
+
+_db_pools = {}
+_db_pools_lock = threading.Lock()
+
+def _db_pool(path):
+    with _db_pools_lock:
+        return _db_pools.setdefault(path, queue.LifoQueue(maxsize=current_app.config["DB_POOL_SIZE"]))
+
+def connect_db(path):
+    conn = sqlite3.connect(
+        path,
+        timeout=current_app.config["DB_BUSY_TIMEOUT"] / 1000,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=current_app.config["DB_STATEMENT_CACHE"],
+        factory=InstrumentedConnection
+    )
+    conn.row_factory = sqlite3.Row
+    conn.slow_query_ms = current_app.config["SLOW_QUERY_MS"]
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(current_app.config['DB_BUSY_TIMEOUT'])}")
+    return conn
+
+def get_db():
+    if "db" not in g:
+        path = current_app.config["DATABASE"]
+        try:
+            conn = _db_pool(path).get_nowait()
+        except queue.Empty:
+            conn = connect_db(path)
+        g.db = conn
+        g.db_path = path
+    return g.db
+
+def close_db(exc):
+    conn = g.pop("db", None)
+    if conn is None:
+        return
+
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _db_pool(g.pop("db_path")).put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+@contextmanager
+def transaction(conn=None):
+    """BEGIN IMMEDIATE ... COMMIT, or join the transaction already open on conn."""
+    conn = conn or get_db()
+    if conn.in_transaction:
+        yield conn
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
 
 # -----------------------------
 # INITIALISE DB
 # -----------------------------
-def init_db():
-    conn = sqlite3.connect('database.db')
+def init_db(path=None):
+    conn = sqlite3.connect(path or current_app.config["DATABASE"])
+    conn.execute("PRAGMA journal_mode=WAL")
     c = conn.cursor()
 
     c.execute("""
@@ -41,6 +370,15 @@ def init_db():
     );
     """)
 
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS postcode_cache (
+        postcode TEXT PRIMARY KEY,
+        latitude REAL,
+        longitude REAL,
+        fetched_at REAL NOT NULL
+    );
+    """)
+
     c.execute("""
     CREATE TABLE IF NOT EXISTS admin (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -49,76 +387,962 @@ def init_db():
     );
     """)
 
+    run_migrations(conn)
+
     conn.commit()
     conn.close()
 
-init_db()
+# -----------------------------
+# SCHEMA MIGRATIONS
+# -----------------------------
+# Each entry upgrades the schema by one version. The applied version is kept
+# in PRAGMA user_version, so only new entries run against an existing db.
+# Append new migrations to the end; never edit one that has shipped.
+MIGRATIONS = [
+    # 1: indexes for the dashboard's default ordering and status/branch filters
+    """
+    CREATE INDEX IF NOT EXISTS idx_bookings_date ON bookings (date, booking_time, id);
+    CREATE INDEX IF NOT EXISTS idx_bookings_status_date ON bookings (status, date, booking_time);
+    CREATE INDEX IF NOT EXISTS idx_bookings_branch_date ON bookings (branch, date, booking_time);
+    """,
+    # 2: full-text index for the dashboard search, kept in sync by triggers
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS bookings_fts USING fts5 (
+        name, email, vehicle, make, service, postcode, branch,
+        content='bookings', content_rowid='id', prefix='2 3'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS bookings_fts_insert AFTER INSERT ON bookings BEGIN
+        INSERT INTO bookings_fts (rowid, name, email, vehicle, make, service, postcode, branch)
+        VALUES (new.id, new.name, new.email, new.vehicle, new.make, new.service, new.postcode, new.branch);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS bookings_fts_delete AFTER DELETE ON bookings BEGIN
+        INSERT INTO bookings_fts (bookings_fts, rowid, name, email, vehicle, make, service, postcode, branch)
+        VALUES ('delete', old.id, old.name, old.email, old.vehicle, old.make, old.service, old.postcode, old.branch);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS bookings_fts_update
+    AFTER UPDATE OF name, email, vehicle, make, service, postcode, branch ON bookings BEGIN
+        INSERT INTO bookings_fts (bookings_fts, rowid, name, email, vehicle, make, service, postcode, branch)
+        VALUES ('delete', old.id, old.name, old.email, old.vehicle, old.make, old.service, old.postcode, old.branch);
+        INSERT INTO bookings_fts (rowid, name, email, vehicle, make, service, postcode, branch)
+        VALUES (new.id, new.name, new.email, new.vehicle, new.make, new.service, new.postcode, new.branch);
+    END;
+
+    INSERT INTO bookings_fts (bookings_fts) VALUES ('rebuild');
+    """,
+    # 3: durable queue for background branch assignment
+    """
+    ALTER TABLE bookings ADD COLUMN branch_distance REAL;
+
+    CREATE TABLE IF NOT EXISTS branch_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        booking_id INTEGER NOT NULL UNIQUE,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        run_after REAL NOT NULL,
+        locked_until REAL,
+        last_error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_branch_jobs_run_after ON branch_jobs (run_after);
+    """,
+    # 4: per-branch, per-slot occupancy counters maintained by triggers.
+    # A booking holds a slot unless it is CANCELLED or its branch is UNKNOWN;
+    # bookings still ASSIGNING hold a slot under the "ASSIGNING" pseudo-branch.
+    """
+    CREATE TABLE IF NOT EXISTS slot_occupancy (
+        date TEXT NOT NULL,
+        slot TEXT NOT NULL,
+        branch TEXT NOT NULL,
+        booked INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (date, slot, branch)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS slot_occupancy_insert AFTER INSERT ON bookings
+    WHEN new.branch IS NOT NULL AND new.branch != 'UNKNOWN' AND COALESCE(new.status, '') != 'CANCELLED'
+    BEGIN
+        INSERT INTO slot_occupancy (date, slot, branch, booked) VALUES (new.date, new.booking_time, new.branch, 1)
+        ON CONFLICT (date, slot, branch) DO UPDATE SET booked = booked + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS slot_occupancy_delete AFTER DELETE ON bookings
+    WHEN old.branch IS NOT NULL AND old.branch != 'UNKNOWN' AND COALESCE(old.status, '') != 'CANCELLED'
+    BEGIN
+        UPDATE slot_occupancy SET booked = booked - 1
+        WHERE date = old.date AND slot = old.booking_time AND branch = old.branch;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS slot_occupancy_update_old
+    AFTER UPDATE OF date, booking_time, branch, status ON bookings
+    WHEN old.branch IS NOT NULL AND old.branch != 'UNKNOWN' AND COALESCE(old.status, '') != 'CANCELLED'
+    BEGIN
+        UPDATE slot_occupancy SET booked = booked - 1
+        WHERE date = old.date AND slot = old.booking_time AND branch = old.branch;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS slot_occupancy_update_new
+    AFTER UPDATE OF date, booking_time, branch, status ON bookings
+    WHEN new.branch IS NOT NULL AND new.branch != 'UNKNOWN' AND COALESCE(new.status, '') != 'CANCELLED'
+    BEGIN
+        INSERT INTO slot_occupancy (date, slot, branch, booked) VALUES (new.date, new.booking_time, new.branch, 1)
+        ON CONFLICT (date, slot, branch) DO UPDATE SET booked = booked + 1;
+    END;
+
+    INSERT INTO slot_occupancy (date, slot, branch, booked)
+    SELECT date, booking_time, branch, COUNT(*) FROM bookings
+    WHERE branch IS NOT NULL AND branch != 'UNKNOWN' AND COALESCE(status, '') != 'CANCELLED'
+    GROUP BY date, booking_time, branch;
+    """,
+    # 5: branches move from code into the database
+    """
+    CREATE TABLE IF NOT EXISTS branches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        opens TEXT NOT NULL DEFAULT '08:00',
+        closes TEXT NOT NULL DEFAULT '18:00',
+        slot_minutes INTEGER NOT NULL DEFAULT 60,
+        bays INTEGER NOT NULL DEFAULT 2,
+        closed_days TEXT NOT NULL DEFAULT '6'
+    );
+
+    INSERT OR IGNORE INTO branches (name, lat, lon, opens, closes, slot_minutes, bays, closed_days) VALUES
+        ('Milton Keynes', 52.0406, -0.7594, '08:00', '18:00', 60, 4, '6'),
+        ('Wembley', 51.5530, -0.2960, '08:00', '18:00', 60, 3, '6'),
+        ('Luton', 51.8787, -0.4200, '09:00', '17:00', 60, 2, '5,6');
+    """,
+    # 6: booking counts by date, branch and status for the dashboard stats,
+    # maintained by triggers so reading them never touches bookings
+    """
+    CREATE TABLE IF NOT EXISTS booking_stats (
+        date TEXT NOT NULL,
+        branch TEXT NOT NULL,
+        status TEXT NOT NULL,
+        bookings INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (date, branch, status)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS booking_stats_insert AFTER INSERT ON bookings BEGIN
+        INSERT INTO booking_stats (date, branch, status, bookings)
+        VALUES (new.date, COALESCE(new.branch, ''), COALESCE(new.status, ''), 1)
+        ON CONFLICT (date, branch, status) DO UPDATE SET bookings = bookings + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS booking_stats_delete AFTER DELETE ON bookings BEGIN
+        UPDATE booking_stats SET bookings = bookings - 1
+        WHERE date = old.date AND branch = COALESCE(old.branch, '') AND status = COALESCE(old.status, '');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS booking_stats_update AFTER UPDATE OF date, branch, status ON bookings BEGIN
+        UPDATE booking_stats SET bookings = bookings - 1
+        WHERE date = old.date AND branch = COALESCE(old.branch, '') AND status = COALESCE(old.status, '');
+        INSERT INTO booking_stats (date, branch, status, bookings)
+        VALUES (new.date, COALESCE(new.branch, ''), COALESCE(new.status, ''), 1)
+        ON CONFLICT (date, branch, status) DO UPDATE SET bookings = bookings + 1;
+    END;
+
+    INSERT INTO booking_stats (date, branch, status, bookings)
+    SELECT date, COALESCE(branch, ''), COALESCE(status, ''), COUNT(*) FROM bookings
+    GROUP BY 1, 2, 3;
+    """,
+    # 7: whether the branch was picked by the customer or an admin rather than
+    # assigned by distance; reroute-bookings leaves those bookings where they are.
+    # Earlier bookings did not record the choice and count as assigned.
+    """
+    ALTER TABLE bookings ADD COLUMN branch_chosen INTEGER NOT NULL DEFAULT 0;
+    """,
+]
+
+def run_migrations(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;")
+
+def schema_version(path):
+    conn = sqlite3.connect(path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    return version
 
 # -----------------------------
 # ADMIN ACCOUNT
 # -----------------------------
-ADMIN_EMAIL = "admin@a1autocare.com"
-ADMIN_PASSWORD_HASH = generate_password_hash("admin123")
+# Logins are checked against the precomputed hash in the admin table, seeded by
+# `flask init-db` and changed with `flask set-admin-password`. ADMIN_EMAIL and
+# ADMIN_PASSWORD_HASH in config can supply one instead. Nothing is hashed at
+# startup.
+DEFAULT_ADMIN_EMAIL = "admin@a1autocare.com"
+DEFAULT_CONFIG["ADMIN_EMAIL"] = None
+DEFAULT_CONFIG["ADMIN_PASSWORD_HASH"] = None
+
+def seed_admin():
+    """Create the default admin login if there is none. Returns True if it did."""
+    with transaction() as db:
+        if db.execute("SELECT 1 FROM admin LIMIT 1").fetchone():
+            return False
+        db.execute(
+            "INSERT INTO admin (username, password) VALUES (?, ?)",
+            (DEFAULT_ADMIN_EMAIL, generate_password_hash("admin123"))
+        )
+        return True
+
+def admin_password_hash(email):
+    row = get_db().execute("SELECT password FROM admin WHERE username=?", (email,)).fetchone()
+    if row:
+        return row["password"]
+    if email == current_app.config["ADMIN_EMAIL"]:
+        return current_app.config["ADMIN_PASSWORD_HASH"]
+    return None
 
 # -----------------------------
 # POSTCODE → COORDINATES
 # -----------------------------
-def get_coordinates_from_postcode(postcode):
-    postcode = postcode.replace(" ", "").upper()
+# Lookups go through three tiers before falling back to the bundled outcode
+# table: an in-process LRU, the persistent postcode_cache table and finally
+# postcodes.io over a pooled HTTP session with bounded timeouts.
+DEFAULT_CONFIG["POSTCODES_API_URL"] = "https://api.postcodes.io"
+DEFAULT_CONFIG["GEOCODE_TIMEOUT"] = (2, 3)          # (connect, read) seconds
+DEFAULT_CONFIG["GEOCODE_MEMORY_SIZE"] = 2048
+DEFAULT_CONFIG["GEOCODE_MEMORY_TTL"] = 60 * 60       # 1 hour
+DEFAULT_CONFIG["GEOCODE_DB_TTL"] = 30 * 24 * 60 * 60  # 30 days
+DEFAULT_CONFIG["GEOCODE_COOLDOWN"] = 30  # seconds to skip upstream after an error
+
+OUTCODE_CENTROIDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "outcode_centroids.csv")
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return _MISSING
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Resized from config by create_app().
+GEOCODE_CACHE = TTLCache(DEFAULT_CONFIG["GEOCODE_MEMORY_SIZE"], DEFAULT_CONFIG["GEOCODE_MEMORY_TTL"])
+
+GEOCODE_STATS = {
+    "memory_hits": 0,
+    "memory_misses": 0,
+    "db_hits": 0,
+    "db_misses": 0,
+    "upstream_calls": 0,
+    "upstream_errors": 0,
+    "upstream_skipped": 0,
+    "fallback_hits": 0,
+    "unresolved": 0,
+}
+_geocode_stats_lock = threading.Lock()
+
+
+def _count(stat):
+    with _geocode_stats_lock:
+        GEOCODE_STATS[stat] += 1
+
+
+def geocode_stats():
+    with _geocode_stats_lock:
+        return dict(GEOCODE_STATS)
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """Shared requests.Session so postcodes.io connections are kept alive."""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _http_session = s
+    return _http_session
+
+
+_outcode_centroids = None
+
+
+def load_outcode_centroids():
+    global _outcode_centroids
+    if _outcode_centroids is None:
+        table = {}
+        with open(OUTCODE_CENTROIDS_FILE, newline="") as f:
+            for row in csv.DictReader(f):
+                table[row["outcode"]] = (float(row["latitude"]), float(row["longitude"]))
+        _outcode_centroids = table
+    return _outcode_centroids
+
+
+def normalise_postcode(postcode):
+    return postcode.replace(" ", "").upper()
+
+
+def outcode_fallback(postcode):
+    """Approximate coordinates from the outcode (e.g. MK5), then the area (e.g. MK)."""
+    table = load_outcode_centroids()
+    outcode = postcode[:-3] if len(postcode) > 4 else postcode
+    if outcode in table:
+        return table[outcode]
+    area = ""
+    for ch in outcode:
+        if not ch.isalpha():
+            break
+        area += ch
+    return table.get(area)
+
+
+def _read_postcode_cache(postcode):
+    row = get_db().execute(
+        "SELECT latitude, longitude, fetched_at FROM postcode_cache WHERE postcode=?",
+        (postcode,)
+    ).fetchone()
+
+    if not row or row[2] < time.time() - current_app.config["GEOCODE_DB_TTL"]:
+        return _MISSING
+    if row[0] is None:
+        return None
+    return row[0], row[1]
+
+
+def _write_postcode_cache(postcode, coords):
+    lat, lon = coords if coords else (None, None)
+    with transaction() as db:
+        db.execute(
+            "INSERT OR REPLACE INTO postcode_cache (postcode, latitude, longitude, fetched_at) VALUES (?, ?, ?, ?)",
+            (postcode, lat, lon, time.time())
+        )
+
+
+_upstream_down_until = 0.0
+
+def _upstream_available():
+    """False for GEOCODE_COOLDOWN seconds after an upstream error."""
+    if time.monotonic() < _upstream_down_until:
+        _count("upstream_skipped")
+        return False
+    return True
+
+def _upstream_cooldown_remaining():
+    """Seconds until upstream lookups resume; 0 when they are allowed now."""
+    return max(_upstream_down_until - time.monotonic(), 0.0)
+
+def _upstream_failed():
+    global _upstream_down_until
+    _count("upstream_errors")
+    _upstream_down_until = time.monotonic() + current_app.config["GEOCODE_COOLDOWN"]
+
+def _fetch_postcode(postcode):
+    """Ask postcodes.io. Returns coords, None for an invalid postcode, or _MISSING on error."""
+    if not _upstream_available():
+        return _MISSING
+    import requests
+
+    _count("upstream_calls")
+    start = time.perf_counter()
+    outcome = "error"
     try:
-        res = requests.get(f"https://api.postcodes.io/postcodes/{postcode}")
+        res = get_http_session().get(
+            f"{current_app.config['POSTCODES_API_URL']}/postcodes/{postcode}",
+            timeout=current_app.config["GEOCODE_TIMEOUT"]
+        )
+        if res.status_code == 404:
+            outcome = "invalid"
+            return None
+        res.raise_for_status()
         data = res.json()
-        if data.get("status") == 200:
+        if data.get("status") == 200 and data.get("result"):
+            outcome = "ok"
             return data["result"]["latitude"], data["result"]["longitude"]
-    except:
+    except (requests.RequestException, ValueError):
+        pass
+    finally:
+        METRICS["geocode"][0].observe(time.perf_counter() - start, ("single", outcome))
+    _upstream_failed()
+    return _MISSING
+
+
+def lookup_postcode(postcode):
+    """Resolve through the cache tiers and upstream without the outcode fallback."""
+    coords = GEOCODE_CACHE.get(postcode)
+    if coords is not _MISSING:
+        _count("memory_hits")
+        return coords
+    _count("memory_misses")
+
+    coords = _read_postcode_cache(postcode)
+    if coords is not _MISSING:
+        _count("db_hits")
+        GEOCODE_CACHE.set(postcode, coords)
+        return coords
+    _count("db_misses")
+
+    coords = _fetch_postcode(postcode)
+    if coords is _MISSING:
         return None
+
+    GEOCODE_CACHE.set(postcode, coords)
+    _write_postcode_cache(postcode, coords)
+    return coords
+
+
+def get_coordinates_from_postcode(postcode):
+    postcode = normalise_postcode(postcode)
+    if not postcode:
+        _count("unresolved")
+        return None
+
+    coords = lookup_postcode(postcode)
+    if coords:
+        return coords
+
+    coords = outcode_fallback(postcode)
+    if coords:
+        _count("fallback_hits")
+        return coords
+
+    _count("unresolved")
     return None
 
+DEFAULT_CONFIG["GEOCODE_BULK_SIZE"] = 100  # postcodes.io bulk lookup limit
+
+def _read_postcode_cache_many(postcodes):
+    found = {}
+    cutoff = time.time() - current_app.config["GEOCODE_DB_TTL"]
+    postcodes = list(postcodes)
+    for i in range(0, len(postcodes), 500):
+        chunk = postcodes[i:i + 500]
+        rows = get_db().execute(
+            f"SELECT postcode, latitude, longitude FROM postcode_cache "
+            f"WHERE fetched_at >= ? AND postcode IN ({', '.join('?' for _ in chunk)})",
+            [cutoff, *chunk]
+        ).fetchall()
+        for row in rows:
+            found[row["postcode"]] = (row["latitude"], row["longitude"]) if row["latitude"] is not None else None
+    return found
+
+def _fetch_postcodes_bulk(postcodes):
+    """Bulk postcodes.io lookup. Postcodes missing from the result hit an upstream error."""
+    if not _upstream_available():
+        return {}
+    import requests
+
+    _count("upstream_calls")
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        res = get_http_session().post(
+            f"{current_app.config['POSTCODES_API_URL']}/postcodes",
+            json={"postcodes": postcodes},
+            timeout=current_app.config["GEOCODE_TIMEOUT"]
+        )
+        res.raise_for_status()
+        found = {}
+        for item in res.json()["result"]:
+            result = item.get("result")
+            found[normalise_postcode(item["query"])] = (
+                (result["latitude"], result["longitude"]) if result else None
+            )
+        outcome = "ok"
+        return found
+    except (requests.RequestException, ValueError, KeyError, TypeError):
+        _upstream_failed()
+        return {}
+    finally:
+        METRICS["geocode"][0].observe(time.perf_counter() - start, ("bulk", outcome))
+
+def lookup_postcodes(postcodes, fetch=True):
+    """
+    Batch version of lookup_postcode. Returns {postcode: coords or None}; postcodes
+    that could not be resolved because of an upstream error (or that are not
+    cached, when fetch is False) are left out.
+    """
+    results = {}
+    pending = []
+    for postcode in {normalise_postcode(p) for p in postcodes if p}:
+        coords = GEOCODE_CACHE.get(postcode)
+        if coords is _MISSING:
+            _count("memory_misses")
+            pending.append(postcode)
+        else:
+            _count("memory_hits")
+            results[postcode] = coords
+
+    if pending:
+        cached = _read_postcode_cache_many(pending)
+        for postcode in pending:
+            _count("db_hits" if postcode in cached else "db_misses")
+        results.update(cached)
+        pending = [p for p in pending if p not in cached]
+        for postcode, coords in cached.items():
+            GEOCODE_CACHE.set(postcode, coords)
+
+    fetched = {}
+    size = current_app.config["GEOCODE_BULK_SIZE"]
+    for i in range(0, len(pending) if fetch else 0, size):
+        fetched.update(_fetch_postcodes_bulk(pending[i:i + size]))
+
+    if fetched:
+        now = time.time()
+        with transaction() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO postcode_cache (postcode, latitude, longitude, fetched_at) VALUES (?, ?, ?, ?)",
+                [(p, *(c if c else (None, None)), now) for p, c in fetched.items()]
+            )
+        for postcode, coords in fetched.items():
+            GEOCODE_CACHE.set(postcode, coords)
+        results.update(fetched)
+
+    return results
+
 # -----------------------------
 # DISTANCE CALCULATION
 # -----------------------------
+EARTH_RADIUS_KM = 6371
+
 def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371
-    d_lat = math.radians(lat2 - lat1)
-    d_lon = math.radians(lon2 - lon1)
+    """Haversine distance in km. Accepts scalars or NumPy arrays (broadcast)."""
+    import numpy as np
+
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
     a = (
-        math.sin(d_lat / 2)**2 +
-        math.cos(math.radians(lat1)) *
-        math.cos(math.radians(lat2)) *
-        math.sin(d_lon / 2)**2
+        np.sin((lat2 - lat1) / 2)**2 +
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+# -----------------------------
+# BRANCH INDEX
+# -----------------------------
+# Branch positions are kept as unit vectors on the sphere. The nearest branch
+# to a point is the one with the largest dot product, so a whole batch of
+# coordinates is answered with one matrix product and an argmax. Branches are
+# reloaded from the database at most every BRANCH_CACHE_SECONDS, or straight
+# away after invalidate_branch_cache().
+DEFAULT_CONFIG["BRANCH_CACHE_SECONDS"] = 60
+
+def _unit_vectors(lats, lons):
+    import numpy as np
+
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    return np.column_stack((np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)))
+
+
+class BranchIndex:
+    def __init__(self, branches):
+        import numpy as np
+
+        self.branches = branches
+        self.lats = np.array([b["lat"] for b in branches], dtype=float)
+        self.lons = np.array([b["lon"] for b in branches], dtype=float)
+        self.vectors = _unit_vectors(self.lats, self.lons)
+
+    def nearest(self, lats, lons):
+        """Index of the nearest branch and its distance in km for each point."""
+        import numpy as np
+
+        points = _unit_vectors(lats, lons)
+        best = np.argmax(points @ self.vectors.T, axis=1)
+        distances = calculate_distance(lats, lons, self.lats[best], self.lons[best])
+        return best, distances
+
+    def ranked(self, lat, lon):
+        """Every branch with its distance in km from one point, nearest first."""
+        distances = calculate_distance(lat, lon, self.lats, self.lons)
+        return [(self.branches[i], round(float(distances[i]), 1)) for i in distances.argsort()]
+
+
+_branch_cache_lock = threading.Lock()
+
+def _new_branch_cache():
+    return {"loaded_at": None, "branches": [], "by_name": {}, "index": None}
+
+def _load_branches(cache):
+    branches = []
+    for row in get_db().execute("SELECT * FROM branches ORDER BY id"):
+        branch = dict(row)
+        branch["closed_days"] = [int(d) for d in row["closed_days"].split(",") if d.strip()]
+        branches.append(branch)
+
+    cache.update(
+        loaded_at=time.monotonic(),
+        branches=branches,
+        by_name={b["name"]: b for b in branches},
+        index=BranchIndex(branches) if branches else None
     )
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+
+def _branch_state():
+    cache = current_app.extensions["branch_cache"]
+    loaded_at = cache["loaded_at"]
+    if loaded_at is None or time.monotonic() - loaded_at > current_app.config["BRANCH_CACHE_SECONDS"]:
+        with _branch_cache_lock:
+            _load_branches(cache)
+    return cache
+
+def invalidate_branch_cache():
+    current_app.extensions["branch_cache"]["loaded_at"] = None
+
+def get_branches():
+    return _branch_state()["branches"]
+
+def get_branch(name):
+    return _branch_state()["by_name"].get(name)
 
 # -----------------------------
 # FIND NEAREST BRANCH
 # -----------------------------
 def find_nearest_branch(user_lat, user_lon):
-    nearest = None
-    shortest = float("inf")
+    index = _branch_state()["index"]
+    best, distances = index.nearest([user_lat], [user_lon])
+    return index.branches[best[0]], round(float(distances[0]), 1)
+
+def find_nearest_branches(coords):
+    """Batch version of find_nearest_branch for a list of (lat, lon) pairs."""
+    if not coords:
+        return []
+    index = _branch_state()["index"]
+    lats, lons = zip(*coords)
+    best, distances = index.nearest(lats, lons)
+    return [(index.branches[i], round(float(d), 1)) for i, d in zip(best, distances)]
 
-    for branch in BRANCHES:
-        dist = calculate_distance(user_lat, user_lon, branch["lat"], branch["lon"])
-        if dist < shortest:
-            shortest = dist
-            nearest = branch
-    return nearest, round(shortest, 1)
+def branches_by_distance(user_lat, user_lon):
+    """Every branch with its distance in km, nearest first."""
+    return _branch_state()["index"].ranked(user_lat, user_lon)
+
+# -----------------------------
+# SLOT AVAILABILITY
+# -----------------------------
+# slot_occupancy holds one counter per (date, slot, branch), kept in step with
+# bookings by triggers (migration 4). A capacity check is a single primary-key
+# range read for one date and slot, whatever the size of bookings.
+# Bookings still waiting for a branch are counted under "ASSIGNING" and held
+# against the combined capacity of every branch open at that time.
+SLOT_OCCUPANCY_SQL = """
+    SELECT date, booking_time AS slot, branch, COUNT(*) AS booked FROM bookings
+    WHERE branch IS NOT NULL AND branch != 'UNKNOWN' AND COALESCE(status, '') != 'CANCELLED'
+    GROUP BY date, booking_time, branch
+"""
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def branch_slots(branch, day):
+    """Slot start times ("HH:MM") for a branch on a date, empty when closed."""
+    if day.weekday() in branch["closed_days"]:
+        return []
+    step = branch["slot_minutes"]
+    start, end = _minutes(branch["opens"]), _minutes(branch["closes"])
+    return [f"{m // 60:02d}:{m % 60:02d}" for m in range(start, end - step + 1, step)]
+
+def parse_booking_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def slot_occupancy(db, date_val, slot=None):
+    """{(slot, branch): booked} for a date, or for one slot of that date."""
+    if slot is None:
+        rows = db.execute("SELECT slot, branch, booked FROM slot_occupancy WHERE date=?", (date_val,))
+    else:
+        rows = db.execute(
+            "SELECT slot, branch, booked FROM slot_occupancy WHERE date=? AND slot=?", (date_val, slot)
+        )
+    return {(row["slot"], row["branch"]): row["booked"] for row in rows}
+
+def _slot_remaining(occupancy, day, slot, branch=None):
+    open_branches = [b for b in get_branches() if slot in branch_slots(b, day)]
+    total_free = (
+        sum(b["bays"] for b in open_branches)
+        - sum(booked for (s, _), booked in occupancy.items() if s == slot)
+    )
+    if branch is None:
+        return max(total_free, 0)
+    if branch not in open_branches:
+        return 0
+    return max(min(branch["bays"] - occupancy.get((slot, branch["name"]), 0), total_free), 0)
+
+def slot_remaining(db, date_val, slot, branch=None):
+    day = parse_booking_date(date_val)
+    if day is None:
+        return 0
+    return _slot_remaining(slot_occupancy(db, date_val, slot), day, slot, branch)
+
+def day_availability(db, date_val, branch=None):
+    """Every slot on a date with the bays left, for one branch or across all."""
+    day = parse_booking_date(date_val)
+    if day is None:
+        return []
+
+    candidates = [branch] if branch else get_branches()
+    slots = sorted({slot for b in candidates for slot in branch_slots(b, day)})
+    occupancy = slot_occupancy(db, date_val)
+    return [
+        {"time": slot, "remaining": _slot_remaining(occupancy, day, slot, branch)}
+        for slot in slots
+    ]
+
+def slot_alternatives(db, date_val, slot, branch=None, limit=3):
+    """Nearby free times on the same day, and other branches free at the requested time."""
+    free = [s["time"] for s in day_availability(db, date_val, branch) if s["remaining"] > 0]
+    free.sort(key=lambda t: abs(_minutes(t) - _minutes(slot)))
+    other_branches = [
+        b["name"] for b in get_branches()
+        if b is not branch and slot_remaining(db, date_val, slot, b) > 0
+    ]
+    return sorted(free[:limit]), other_branches
+
+# -----------------------------
+# BACKGROUND BRANCH ASSIGNMENT
+# -----------------------------
+# /book stores the booking with branch "ASSIGNING" and queues a row in
+# branch_jobs. Worker threads claim due jobs in batches, geocode them with one
+# bulk lookup and write the nearest branch back. Upstream errors are retried
+# with exponential backoff; after the last attempt (or for an invalid
+# postcode) the outcode fallback is used, and failing that "UNKNOWN".
+BRANCH_ASSIGNING = "ASSIGNING"
+BRANCH_UNKNOWN = "UNKNOWN"
+
+DEFAULT_CONFIG["BRANCH_WORKERS"] = 2
+DEFAULT_CONFIG["BRANCH_BATCH_SIZE"] = 50
+DEFAULT_CONFIG["BRANCH_MAX_ATTEMPTS"] = 5
+DEFAULT_CONFIG["BRANCH_RETRY_DELAY"] = 5       # seconds, doubled per attempt
+DEFAULT_CONFIG["BRANCH_LOCK_SECONDS"] = 60     # reclaim jobs from crashed workers
+DEFAULT_CONFIG["BRANCH_POLL_INTERVAL"] = 5
+
+def _new_branch_workers():
+    return {"wakeup": threading.Event(), "threads": [], "lock": threading.Lock()}
+
+def enqueue_branch_jobs(db, booking_ids):
+    db.executemany(
+        "INSERT OR IGNORE INTO branch_jobs (booking_id, run_after) VALUES (?, ?)",
+        [(booking_id, time.time()) for booking_id in booking_ids]
+    )
+
+def notify_branch_workers():
+    app = current_app._get_current_object()
+    start_branch_workers(app)
+    app.extensions["branch_workers"]["wakeup"].set()
+
+def claim_branch_jobs(db, limit, due_before=None):
+    now = time.time()
+    due_before = now if due_before is None else due_before
+    # An idle poll only reads, so workers don't take the write lock from /book
+    # while the queue is empty.
+    if not db.execute("""
+        SELECT 1 FROM branch_jobs
+        WHERE run_after <= ? AND (locked_until IS NULL OR locked_until < ?)
+        LIMIT 1
+    """, (due_before, now)).fetchone():
+        return []
+
+    with transaction(db):
+        return db.execute("""
+            UPDATE branch_jobs
+            SET locked_until=?, attempts=attempts + 1
+            WHERE id IN (
+                SELECT id FROM branch_jobs
+                WHERE run_after <= ? AND (locked_until IS NULL OR locked_until < ?)
+                ORDER BY run_after
+                LIMIT ?
+            )
+            RETURNING id, booking_id, attempts
+        """, (now + current_app.config["BRANCH_LOCK_SECONDS"], due_before, now, limit)).fetchall()
+
+def process_branch_jobs(db, limit=None, due_before=None):
+    """
+    Claim and resolve one batch of jobs. Returns the number of jobs finished;
+    jobs put back for a retry are not counted.
+    """
+    jobs = claim_branch_jobs(db, limit or current_app.config["BRANCH_BATCH_SIZE"], due_before)
+    if not jobs:
+        return 0
+
+    ids = [job["booking_id"] for job in jobs]
+    bookings = {
+        row["id"]: row
+        for row in db.execute(
+            f"SELECT id, postcode, date, booking_time FROM bookings WHERE id IN ({', '.join('?' for _ in ids)})",
+            ids
+        )
+    }
+    postcodes = {booking_id: normalise_postcode(row["postcode"] or "") for booking_id, row in bookings.items()}
+    # While postcodes.io is cooling down this pass only sees the caches, so an
+    # unresolved job waits out the cooldown without using up an attempt.
+    cooldown = _upstream_cooldown_remaining()
+    resolved = lookup_postcodes(postcodes.values())
+
+    located = []
+    retries = []
+    finished = []
+    for job in jobs:
+        booking_id = job["booking_id"]
+        finished.append((job["id"],))
+        if booking_id not in postcodes:
+            continue
+
+        postcode = postcodes[booking_id]
+        attempts = job["attempts"] - 1 if cooldown else job["attempts"]
+        if postcode in resolved or attempts >= current_app.config["BRANCH_MAX_ATTEMPTS"]:
+            coords = resolved.get(postcode)
+            if not coords:
+                coords = outcode_fallback(postcode) if postcode else None
+                _count("fallback_hits" if coords else "unresolved")
+            located.append((bookings[booking_id], coords))
+        else:
+            finished.pop()
+            if cooldown:
+                retries.append((time.time() + cooldown, "postcodes.io cooling down", 1, job["id"]))
+            else:
+                delay = current_app.config["BRANCH_RETRY_DELAY"] * 2 ** (attempts - 1)
+                retries.append((time.time() + delay, "postcode lookup failed", 0, job["id"]))
+
+    with transaction(db):
+        # One booking at a time: each UPDATE moves the booking's slot out of
+        # ASSIGNING, so the next pick sees up-to-date occupancy.
+        for booking, coords in located:
+            if coords:
+                branch, distance_km = pick_branch(db, booking, coords)
+                branch_name = branch["name"]
+            else:
+                branch_name, distance_km = BRANCH_UNKNOWN, None
+            db.execute(
+                "UPDATE bookings SET branch=?, branch_distance=? WHERE id=? AND branch='ASSIGNING'",
+                (branch_name, distance_km, booking["id"])
+            )
+        db.executemany(
+            "UPDATE branch_jobs SET run_after=?, locked_until=NULL, last_error=?, attempts=attempts - ? WHERE id=?",
+            retries
+        )
+        db.executemany("DELETE FROM branch_jobs WHERE id=?", finished)
+
+    return len(finished)
+
+def first_free_branch(ranked, day, slot, occupancy, current=None):
+    """
+    The first (branch, distance) in ranked with a free bay in the slot. Returns
+    None if there is none, or if `current` (the branch the booking already
+    holds a bay at) comes first.
+    """
+    for branch, distance_km in ranked:
+        if branch["name"] == current:
+            return None
+        if slot in branch_slots(branch, day) and occupancy.get((slot, branch["name"]), 0) < branch["bays"]:
+            return branch, distance_km
+    return None
+
+def pick_branch(db, booking, coords, held=None):
+    """
+    The nearest branch with a free bay in the booking's slot, else the nearest.
+    `held` names a branch where the booking already has a bay in that slot;
+    that bay counts as free.
+    """
+    ranked = branches_by_distance(*coords)
+    day = parse_booking_date(booking["date"])
+    if day is None:
+        return ranked[0]
+
+    slot = booking["booking_time"]
+    occupancy = slot_occupancy(db, booking["date"], slot)
+    if (slot, held) in occupancy:
+        occupancy[(slot, held)] -= 1
+    return first_free_branch(ranked, day, slot, occupancy) or ranked[0]
+
+def drain_branch_jobs(db, batch_size=500):
+    """
+    Process every queued job now, ignoring backoff. Stops once a pass finishes
+    nothing, which leaves jobs that failed to geocode queued for the workers
+    to retry on schedule. Returns the number of jobs finished.
+    """
+    processed = 0
+    while True:
+        finished = process_branch_jobs(db, batch_size, due_before=float("inf"))
+        if not finished:
+            return processed
+        processed += finished
+
+def _branch_worker_loop(app):
+    # Drain first, then sleep: a fresh worker picks up whatever a restart or
+    # `import-bookings --defer-assignment` left in branch_jobs.
+    wakeup = app.extensions["branch_workers"]["wakeup"]
+    while True:
+        try:
+            while True:
+                with app.app_context():
+                    if not process_branch_jobs(get_db()):
+                        break
+        except Exception:
+            app.logger.exception("Branch assignment worker failed")
+        wakeup.wait(app.config["BRANCH_POLL_INTERVAL"])
+        wakeup.clear()
+
+def start_branch_workers(app):
+    """Start this app's worker threads if they are not running yet."""
+    workers = app.extensions["branch_workers"]
+    if len(workers["threads"]) >= app.config["BRANCH_WORKERS"]:
+        return
+    with workers["lock"]:
+        while len(workers["threads"]) < app.config["BRANCH_WORKERS"]:
+            worker = threading.Thread(target=_branch_worker_loop, args=(app,), name="branch-worker", daemon=True)
+            worker.start()
+            workers["threads"].append(worker)
+
+def _start_branch_workers():
+    """before_request hook, so queued jobs don't wait for the next booking."""
+    start_branch_workers(current_app._get_current_object())
 
 # -----------------------------
 # ROUTES
 # -----------------------------
-@app.route("/")
+@bp.route("/")
 def home():
     return render_template("index.html")
 
-@app.route("/about")
+@bp.route("/about")
 def about():
     return render_template("about.html")
 
 # -----------------------------
 # BOOKING PAGE
 # -----------------------------
-@app.route("/book", methods=["GET", "POST"])
+@bp.route("/book", methods=["GET", "POST"])
 def book():
     if request.method == "POST":
         name = request.form["name"]
@@ -130,72 +1354,105 @@ def book():
         date_val = request.form["date"]
         booking_time = request.form["booking_time"]
         postcode = request.form["postcode"].replace(" ", "").upper()
+        branch = get_branch(request.form.get("branch", ""))
 
-        coords = get_coordinates_from_postcode(postcode)
+        day = parse_booking_date(date_val)
+        if day is None or day < date.today():
+            flash("Please choose a date that is not in the past.", "warning")
+            return redirect(url_for("main.book"))
 
-        branch_name = "UNKNOWN"
-        branch_distance = None
+        candidates = [branch] if branch else get_branches()
+        if not any(booking_time in branch_slots(b, day) for b in candidates):
+            flash("Sorry, that time isn't bookable. Please pick one of the available slots.", "warning")
+            return redirect(url_for("main.book"))
 
-        if coords:
-            user_lat, user_lon = coords
-            nearest_branch, distance_km = find_nearest_branch(user_lat, user_lon)
-            branch_name = nearest_branch["name"]
-            branch_distance = distance_km
-        else:
-            flash("Invalid postcode. Nearest branch not assigned.", "warning")
+        # The capacity check and the insert share one write transaction, so two
+        # customers can't both take the last bay. Without a chosen branch the
+        # nearest one is worked out in the background so the customer never
+        # waits on the geocoder; see BACKGROUND BRANCH ASSIGNMENT.
+        booking_id = None
+        with transaction() as db:
+            if slot_remaining(db, date_val, booking_time, branch) > 0:
+                cur = db.execute("""
+                    INSERT INTO bookings
+                    (name, email, vehicle, make, service, notes, date, booking_time, postcode, branch,
+                     branch_chosen, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (name, email, vehicle, make, service, notes, date_val, booking_time, postcode,
+                      branch["name"] if branch else BRANCH_ASSIGNING, bool(branch), "PENDING"))
+                booking_id = cur.lastrowid
+                if not branch:
+                    enqueue_branch_jobs(db, [booking_id])
+            else:
+                free_times, other_branches = slot_alternatives(db, date_val, booking_time, branch)
 
-        session["nearest_branch_name"] = branch_name
-        session["nearest_branch_distance"] = branch_distance
+        if booking_id is None:
+            where = f" at {branch['name']}" if branch else ""
+            message = f"Sorry, {booking_time} on {date_val} is fully booked{where}."
+            if free_times:
+                message += f" Free times that day: {', '.join(free_times)}."
+            if branch and other_branches:
+                message += f" Also free at {booking_time}: {', '.join(other_branches)}."
+            flash(message, "warning")
+            return redirect(url_for("main.book"))
 
-        conn = sqlite3.connect("database.db")
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO bookings 
-            (name, email, vehicle, make, service, notes, date, booking_time, postcode, branch, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (name, email, vehicle, make, service, notes, date_val, booking_time, postcode, branch_name, "PENDING"))
+        if not branch:
+            notify_branch_workers()
+        session["booking_id"] = booking_id
 
-        conn.commit()
-        conn.close()
+        return redirect(url_for("main.confirm"))
 
-        return redirect(url_for("confirm"))
+    return render_template(
+        "book.html",
+        min_date=date.today(),
+        branches=[b["name"] for b in get_branches()]
+    )
 
-    return render_template("book.html", min_date=date.today())
+# -----------------------------
+# AVAILABILITY API
+# -----------------------------
+@bp.route("/api/availability")
+def availability():
+    date_val = request.args.get("date", "")
+    branch_name = request.args.get("branch", "")
+    branch = get_branch(branch_name)
+
+    if branch_name and not branch:
+        return jsonify({"error": "Unknown branch"}), 404
+    if parse_booking_date(date_val) is None:
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+
+    return jsonify({
+        "date": date_val,
+        "branch": branch["name"] if branch else None,
+        "slots": day_availability(get_db(), date_val, branch)
+    })
 
 # -----------------------------
 # CONFIRMATION PAGE
 # -----------------------------
-@app.route("/confirm")
+@bp.route("/confirm")
 def confirm():
-    conn = sqlite3.connect("database.db")
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM bookings ORDER BY id DESC LIMIT 1")
-    booking = c.fetchone()
-    conn.close()
+    booking = get_db().execute("SELECT * FROM bookings WHERE id=?", (session.get("booking_id"),)).fetchone()
 
     if not booking:
         return "No booking found", 400
 
-    return render_template(
-        "confirm.html",
-        booking=booking,
-        nearest_branch_name=session.get("nearest_branch_name"),
-        nearest_branch_distance=session.get("nearest_branch_distance")
-    )
+    return render_template("confirm.html", booking=booking)
 
 # -----------------------------
 # LOGIN
 # -----------------------------
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         email = request.form["email"]
         password = request.form["password"]
 
-        if email == ADMIN_EMAIL and check_password_hash(ADMIN_PASSWORD_HASH, password):
+        password_hash = admin_password_hash(email)
+        if password_hash and check_password_hash(password_hash, password):
             session["admin_logged_in"] = True
-            return redirect(url_for("dashboard"))
+            return redirect(url_for("main.dashboard"))
 
         flash("Invalid login details.", "danger")
 
@@ -204,119 +1461,908 @@ def login():
 # -----------------------------
 # DASHBOARD
 # -----------------------------
-@app.route("/admin/dashboard")
-def dashboard():
-    if not session.get("admin_logged_in"):
-        return redirect(url_for("login"))
+DEFAULT_CONFIG["DASHBOARD_PAGE_SIZE"] = 50
+DEFAULT_CONFIG["DASHBOARD_MAX_PAGE_SIZE"] = 500
 
-    search = request.args.get("search", "").lower()
-    filter_status = request.args.get("status", "ALL")
+# Dashboard rows are paged with a seek cursor on the sort key, so every page is
+# an index range scan. Without a search the key is (date, booking_time, id),
+# newest first; with a search it is (bm25 rank, id), best match first.
+# Each part is (sql expression, row key, type).
+DATE_SORT = (("date", "date", str), ("booking_time", "booking_time", str), ("id", "id", int))
+RANK_SORT = (("fts.rank", "search_rank", float), ("bookings.id", "id", int))
 
-    conn = sqlite3.connect("database.db")
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+def encode_cursor(row, sort):
+    return "|".join(str(row[key]) for _, key, _ in sort)
 
-    query = "SELECT * FROM bookings WHERE 1=1"
-    params = []
+def decode_cursor(value, sort):
+    try:
+        parts = value.split("|", len(sort) - 1)
+        if len(parts) != len(sort):
+            return None
+        return tuple(cast(part) for part, (_, _, cast) in zip(parts, sort))
+    except (AttributeError, ValueError):
+        return None
 
-    if search:
-        query += """ AND (
-            LOWER(name) LIKE ? OR
-            LOWER(email) LIKE ? OR
-            LOWER(vehicle) LIKE ? OR
-            LOWER(make) LIKE ? OR
-            LOWER(service) LIKE ? OR
-            LOWER(postcode) LIKE ? OR
-            LOWER(branch) LIKE ?
-        )"""
-        for _ in range(7):
-            params.append(f"%{search}%")
+def search_match_expression(search):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    tokens = [f'"{token}"' for token in re.findall(r"\w+", search.lower())]
+    if tokens:
+        tokens[-1] += "*"
+    return " ".join(tokens)
+
+def booking_filters(filter_status, filter_branch):
+    clauses = []
+    params = []
 
     if filter_status != "ALL":
-        query += " AND status=?"
+        clauses.append("status=?")
         params.append(filter_status)
 
-    c.execute(query, params)
-    bookings = c.fetchall()
-    conn.close()
+    if filter_branch != "ALL":
+        clauses.append("branch=?")
+        params.append(filter_branch)
+
+    return clauses, params
+
+def bookings_query(match, params):
+    """The SELECT behind the dashboard: (query, params, sort, descending)."""
+    if match:
+        query = """
+            SELECT bookings.*, fts.rank AS search_rank
+            FROM bookings
+            JOIN (SELECT rowid, rank FROM bookings_fts WHERE bookings_fts MATCH ?) AS fts
+              ON fts.rowid = bookings.id
+        """
+        return query, [match, *params], RANK_SORT, False
+    return "SELECT * FROM bookings", list(params), DATE_SORT, True
+
+def fetch_bookings_page(db, match, clauses, params, page_size, after=None, before=None):
+    """Return (rows, next_cursor, prev_cursor) for one dashboard page."""
+    clauses = list(clauses)
+    query, params, sort, descending = bookings_query(match, params)
+
+    after = decode_cursor(after, sort) if after else None
+    before = decode_cursor(before, sort) if before else None
+    key = "(" + ", ".join(expr for expr, _, _ in sort) + ")"
+    placeholders = "(" + ", ".join("?" for _ in sort) + ")"
+
+    if after:
+        clauses.append(f"{key} {'<' if descending else '>'} {placeholders}")
+        params.extend(after)
+    elif before:
+        clauses.append(f"{key} {'>' if descending else '<'} {placeholders}")
+        params.extend(before)
+        descending = not descending
+
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    order = "DESC" if descending else "ASC"
+    query += " ORDER BY " + ", ".join(f"{expr} {order}" for expr, _, _ in sort) + " LIMIT ?"
+    params.append(page_size + 1)
+
+    rows = db.execute(query, params).fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if before:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, bool(after)
+
+    next_cursor = encode_cursor(rows[-1], sort) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0], sort) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
+
+BOOKING_STATS_SQL = """
+    SELECT date, COALESCE(branch, '') AS branch, COALESCE(status, '') AS status, COUNT(*) AS bookings
+    FROM bookings GROUP BY 1, 2, 3
+"""
+
+def dashboard_stats(db, days=7):
+    """Headline numbers for the stats panel, read from booking_stats."""
+    today = date.today()
+    last_day = today + timedelta(days=days - 1)
+
+    by_status = {
+        row["status"]: row["total"]
+        for row in db.execute(
+            "SELECT status, SUM(bookings) AS total FROM booking_stats GROUP BY status HAVING total > 0"
+        )
+    }
+    by_branch = db.execute("""
+        SELECT branch, SUM(bookings) AS total FROM booking_stats
+        WHERE status != 'CANCELLED' GROUP BY branch HAVING total > 0 ORDER BY total DESC
+    """).fetchall()
+    by_day = {
+        row["date"]: row["total"]
+        for row in db.execute("""
+            SELECT date, SUM(bookings) AS total FROM booking_stats
+            WHERE date BETWEEN ? AND ? AND status != 'CANCELLED' GROUP BY date
+        """, (today.isoformat(), last_day.isoformat()))
+    }
+
+    active = sum(by_status.values()) - by_status.get("CANCELLED", 0)
+    return {
+        "today": by_day.get(today.isoformat(), 0),
+        "pending": by_status.get("PENDING", 0),
+        "completion_rate": round(100 * by_status.get("COMPLETED", 0) / active, 1) if active else None,
+        "by_status": by_status,
+        "by_branch": by_branch,
+        "by_day": [
+            ((today + timedelta(days=i)).isoformat(), by_day.get((today + timedelta(days=i)).isoformat(), 0))
+            for i in range(days)
+        ],
+    }
+
+@bp.route("/admin/dashboard")
+def dashboard():
+    if not session.get("admin_logged_in"):
+        return redirect(url_for("main.login"))
+
+    search = request.args.get("search", "").lower()
+    filter_status = request.args.get("status", "ALL")
+    filter_branch = request.args.get("branch", "ALL")
+    page_size = request.args.get("per_page", current_app.config["DASHBOARD_PAGE_SIZE"], type=int)
+    page_size = max(1, min(page_size, current_app.config["DASHBOARD_MAX_PAGE_SIZE"]))
+    after = request.args.get("after")
+    before = request.args.get("before")
+
+    clauses, params = booking_filters(filter_status, filter_branch)
+    bookings, next_cursor, prev_cursor = fetch_bookings_page(
+        get_db(), search_match_expression(search), clauses, params, page_size, after=after, before=before
+    )
 
     return render_template(
         "dashboard.html",
         bookings=bookings,
         search=search,
-        filter_status=filter_status
+        filter_status=filter_status,
+        filter_branch=filter_branch,
+        branches=[branch["name"] for branch in get_branches()],
+        statuses=BOOKING_STATUSES,
+        stats=dashboard_stats(get_db()),
+        per_page=page_size,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor
+    )
+
+# -----------------------------
+# EXPORT BOOKINGS
+# -----------------------------
+DEFAULT_CONFIG["EXPORT_FETCH_SIZE"] = 1000
+
+EXPORT_COLUMNS = [
+    "id", "name", "email", "vehicle", "make", "service", "notes", "date",
+    "booking_time", "postcode", "branch", "branch_distance", "branch_chosen", "status"
+]
+
+def _csv_line(values):
+    buf = io.StringIO()
+    csv.writer(buf).writerow(values)
+    return buf.getvalue()
+
+@bp.route("/admin/export")
+def export_bookings():
+    """Stream every booking matching the dashboard filters as CSV or NDJSON."""
+    if not session.get("admin_logged_in"):
+        return redirect(url_for("main.login"))
+
+    export_format = request.args.get("format", "csv")
+    if export_format not in ("csv", "ndjson"):
+        return "Unsupported export format", 400
+
+    search = request.args.get("search", "").lower()
+    clauses, params = booking_filters(request.args.get("status", "ALL"), request.args.get("branch", "ALL"))
+    query, params, sort, descending = bookings_query(search_match_expression(search), params)
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    order = "DESC" if descending else "ASC"
+    query += " ORDER BY " + ", ".join(f"{expr} {order}" for expr, _, _ in sort)
+
+    # Rows are pulled from the cursor a chunk at a time while the response is
+    # being sent, so memory use doesn't grow with the size of the export.
+    def generate():
+        cur = get_db().execute(query, params)
+        if export_format == "csv":
+            yield _csv_line(EXPORT_COLUMNS)
+        while True:
+            rows = cur.fetchmany(current_app.config["EXPORT_FETCH_SIZE"])
+            if not rows:
+                break
+            if export_format == "csv":
+                yield "".join(_csv_line([row[col] for col in EXPORT_COLUMNS]) for row in rows)
+            else:
+                yield "".join(json.dumps({col: row[col] for col in EXPORT_COLUMNS}) + "\n" for row in rows)
+
+    mimetype = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    filename = f"bookings-{date.today().isoformat()}.{export_format}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 # -----------------------------
 # EDIT BOOKING
 # -----------------------------
-@app.route("/admin/edit/<int:id>", methods=["GET", "POST"])
+EDITABLE_FIELDS = (
+    "name", "email", "vehicle", "make", "service", "notes", "date", "booking_time", "postcode", "status"
+)
+
+def booking_changes(booking, form):
+    """The edit-form fields whose submitted value differs from the stored booking."""
+    changes = {}
+    for field in EDITABLE_FIELDS:
+        value = form[field]
+        stored = booking[field] or ""
+        if field == "postcode":
+            value, stored = normalise_postcode(value), normalise_postcode(stored)
+        elif field == "status":
+            value = value.upper()
+        if value != stored:
+            changes[field] = value
+    return changes
+
+@bp.route("/admin/edit/<int:id>", methods=["GET", "POST"])
 def edit_booking(id):
-    conn = sqlite3.connect("database.db")
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    if not session.get("admin_logged_in"):
+        return redirect(url_for("main.login"))
+
+    booking = get_db().execute("SELECT * FROM bookings WHERE id=?", (id,)).fetchone()
+
+    if not booking:
+        flash("Booking not found.", "warning")
+        return redirect(url_for("main.dashboard"))
 
     if request.method == "POST":
-        name = request.form["name"]
-        email = request.form["email"]
-        vehicle = request.form["vehicle"]
-        make = request.form["make"]
-        service = request.form["service"]
-        notes = request.form["notes"]
-        date_val = request.form["date"]
-        booking_time = request.form["booking_time"]
+        changes = booking_changes(booking, request.form)
 
-        postcode = request.form["postcode"].replace(" ", "").upper()
-        status = request.form["status"].upper()
+        if not changes:
+            flash("No changes to save.", "info")
+            return redirect(url_for("main.dashboard"))
 
-        coords = get_coordinates_from_postcode(postcode)
-        branch_name = "UNKNOWN"
+        # Only a new postcode can move the booking, so that is the only time
+        # the geocoder is asked. Writing just the changed columns also keeps
+        # the search-index and occupancy triggers quiet for untouched fields.
+        coords = get_coordinates_from_postcode(changes["postcode"]) if "postcode" in changes else None
 
-        if coords:
-            user_lat, user_lon = coords
-            nearest_branch, _ = find_nearest_branch(user_lat, user_lon)
-            branch_name = nearest_branch["name"]
+        with transaction() as db:
+            if "postcode" in changes:
+                changes["branch"] = BRANCH_UNKNOWN
+                changes["branch_distance"] = None
+                changes["branch_chosen"] = False
 
-        c.execute("""
-            UPDATE bookings
-            SET name=?, email=?, vehicle=?, make=?, service=?, notes=?, date=?, booking_time=?, 
-                status=?, postcode=?, branch=?
-            WHERE id=?
-        """, (name, email, vehicle, make, service, notes, date_val, booking_time,
-              status, postcode, branch_name, id))
+                if coords:
+                    # Its current bay only counts if the booking stays in that slot.
+                    same_slot = "date" not in changes and "booking_time" not in changes
+                    held = booking["branch"] if same_slot and booking["status"] != "CANCELLED" else None
+                    branch, changes["branch_distance"] = pick_branch(db, {**booking, **changes}, coords, held)
+                    changes["branch"] = branch["name"]
 
-        conn.commit()
-        conn.close()
+            assignments = ", ".join(f"{column}=?" for column in changes)
+            db.execute(f"UPDATE bookings SET {assignments} WHERE id=?", (*changes.values(), id))
 
         flash("Booking updated successfully!", "success")
-        return redirect(url_for("dashboard"))
-
-    c.execute("SELECT * FROM bookings WHERE id=?", (id,))
-    booking = c.fetchone()
-    conn.close()
+        return redirect(url_for("main.dashboard"))
 
     return render_template("edit.html", booking=booking)
 
 # -----------------------------
 # DELETE BOOKING
 # -----------------------------
-@app.route("/admin/delete/<int:id>", methods=["POST"])
+@bp.route("/admin/delete/<int:id>", methods=["POST"])
 def delete_booking(id):
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-    c.execute("DELETE FROM bookings WHERE id=?", (id,))
-    conn.commit()
-    conn.close()
+    if not session.get("admin_logged_in"):
+        return redirect(url_for("main.login"))
+
+    with transaction() as db:
+        db.execute("DELETE FROM bookings WHERE id=?", (id,))
+
+    return redirect(url_for("main.dashboard"))
+
+# -----------------------------
+# BULK ACTIONS
+# -----------------------------
+BULK_ACTIONS = ("status", "branch", "delete")
+
+def bulk_branch_updates(db, ids, branch):
+    """(branch, distance, id) rows for moving bookings to branch, using cached coordinates only."""
+    import numpy as np
+
+    rows = db.execute(
+        f"SELECT id, postcode FROM bookings WHERE id IN ({', '.join('?' * len(ids))}) AND branch != ?",
+        (*ids, branch["name"])
+    ).fetchall()
+    postcodes = [normalise_postcode(row["postcode"] or "") for row in rows]
+    resolved = lookup_postcodes(postcodes, fetch=False)
+    coords = [resolved.get(postcode) or (outcode_fallback(postcode) if postcode else None) for postcode in postcodes]
+
+    located = [i for i, c in enumerate(coords) if c]
+    distances = [None] * len(rows)
+    if located:
+        lats, lons = np.array([coords[i] for i in located]).T
+        for i, km in zip(located, calculate_distance(lats, lons, branch["lat"], branch["lon"])):
+            distances[i] = round(float(km), 1)
+
+    return [(branch["name"], km, row["id"]) for row, km in zip(rows, distances)]
+
+@bp.route("/admin/bulk", methods=["POST"])
+def bulk_action():
+    """Apply one status change, branch reassignment or delete to the selected bookings."""
+    if not session.get("admin_logged_in"):
+        return redirect(url_for("main.login"))
+
+    back = url_for(
+        "main.dashboard",
+        search=request.form.get("search") or None,
+        status=request.form.get("filter_status", "ALL"),
+        branch=request.form.get("filter_branch", "ALL")
+    )
+    action = request.form.get("action", "")
+    ids = sorted({int(i) for i in request.form.getlist("ids") if i.isdigit()})
+
+    if action not in BULK_ACTIONS:
+        flash("Choose a bulk action.", "warning")
+        return redirect(back)
+    if not ids:
+        flash("Select at least one booking.", "warning")
+        return redirect(back)
 
-    return redirect(url_for("dashboard"))
+    if action == "status":
+        status = request.form.get("new_status", "").upper()
+        if status not in BOOKING_STATUSES:
+            flash("Choose a status to apply.", "warning")
+            return redirect(back)
+        sql = "UPDATE bookings SET status=? WHERE id=? AND status != ?"
+        rows = [(status, i, status) for i in ids]
+        outcome = f"marked {status.title()}"
+
+    elif action == "branch":
+        branch = get_branch(request.form.get("new_branch", ""))
+        if not branch:
+            flash("Choose a branch to move the bookings to.", "warning")
+            return redirect(back)
+        sql = "UPDATE bookings SET branch=?, branch_distance=?, branch_chosen=1 WHERE id=?"
+        outcome = f"moved to {branch['name']}"
+
+    else:
+        sql = "DELETE FROM bookings WHERE id=?"
+        rows = [(i,) for i in ids]
+        outcome = "deleted"
+
+    # One write transaction and one executemany however many rows are
+    # selected; the triggers keep the search index and stats in step.
+    with transaction() as db:
+        if action == "branch":
+            rows = bulk_branch_updates(db, ids, branch)
+        changed = db.executemany(sql, rows).rowcount
+
+    flash(f"{changed} booking(s) {outcome}.", "success")
+    return redirect(back)
+
+# -----------------------------
+# GEOCODER STATS
+# -----------------------------
+@bp.route("/admin/geocode-stats")
+def geocode_stats_view():
+    if not session.get("admin_logged_in"):
+        return redirect(url_for("main.login"))
+
+    return jsonify(geocode_stats())
+
+# -----------------------------
+# METRICS ENDPOINT
+# -----------------------------
+@bp.route("/admin/metrics")
+def metrics():
+    token = current_app.config["METRICS_TOKEN"]
+    authorised = session.get("admin_logged_in") or (
+        token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+    )
+    if not authorised:
+        return "Unauthorized", 401
+
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 
 # -----------------------------
 # LOGOUT
 # -----------------------------
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     session.pop("admin_logged_in", None)
-    return redirect(url_for("login"))
+    return redirect(url_for("main.login"))
+
+# -----------------------------
+# CLI COMMANDS
+# -----------------------------
+@bp.cli.command("init-db")
+def init_db_command():
+    """Create or upgrade the schema and seed the default admin account."""
+    init_db()
+    click.echo(f"Schema is at version {len(MIGRATIONS)}.")
+
+    if seed_admin():
+        click.echo(f"Created {DEFAULT_ADMIN_EMAIL} with the default password; "
+                   "change it with set-admin-password.")
+
+@bp.cli.command("set-admin-password")
+@click.argument("email")
+@click.password_option()
+def set_admin_password_command(email, password):
+    """Create an admin login or change its password."""
+    with transaction() as db:
+        db.execute("""
+            INSERT INTO admin (username, password) VALUES (?, ?)
+            ON CONFLICT (username) DO UPDATE SET password = excluded.password
+        """, (email, generate_password_hash(password)))
+    click.echo(f"Password set for {email}.")
+
+@bp.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """Backfill the dashboard full-text index from the bookings table."""
+    with transaction() as db:
+        db.execute("INSERT INTO bookings_fts (bookings_fts) VALUES ('rebuild')")
+    total = get_db().execute("SELECT COUNT(*) FROM bookings").fetchone()[0]
+    click.echo(f"Search index rebuilt for {total} bookings.")
+
+@bp.cli.command("assign-branches")
+@click.option("--reprocess-unknown", is_flag=True, help="Queue bookings left UNKNOWN by past failures.")
+def assign_branches_command(reprocess_unknown):
+    """Drain the branch assignment queue in the foreground."""
+    with transaction() as db:
+        if reprocess_unknown:
+            db.execute("UPDATE bookings SET branch=? WHERE branch=?", (BRANCH_ASSIGNING, BRANCH_UNKNOWN))
+        # Also picks up ASSIGNING rows whose job was lost.
+        db.execute(
+            "INSERT OR IGNORE INTO branch_jobs (booking_id, run_after) SELECT id, ? FROM bookings WHERE branch=?",
+            (time.time(), BRANCH_ASSIGNING)
+        )
+
+    processed = drain_branch_jobs(get_db())
+
+    counts = get_db().execute("""
+        SELECT SUM(branch=?) AS unknown, SUM(branch=?) AS assigning FROM bookings
+    """, (BRANCH_UNKNOWN, BRANCH_ASSIGNING)).fetchone()
+    click.echo(f"Processed {processed} jobs; {counts['unknown'] or 0} bookings still UNKNOWN, "
+               f"{counts['assigning'] or 0} ASSIGNING (queued for retry).")
+
+@bp.cli.command("add-branch")
+@click.argument("name")
+@click.argument("lat", type=float)
+@click.argument("lon", type=float)
+@click.option("--opens", default="08:00", show_default=True)
+@click.option("--closes", default="18:00", show_default=True)
+@click.option("--slot-minutes", default=60, show_default=True)
+@click.option("--bays", default=2, show_default=True)
+@click.option("--closed-days", default="6", show_default=True, help="Comma-separated weekdays, Monday is 0.")
+def add_branch_command(name, lat, lon, opens, closes, slot_minutes, bays, closed_days):
+    """
+    Open a new branch. Run reroute-bookings afterwards to move future bookings.
+    Put -- before the arguments when LON is negative: add-branch -- NAME LAT LON
+    """
+    with transaction() as db:
+        db.execute("""
+            INSERT INTO branches (name, lat, lon, opens, closes, slot_minutes, bays, closed_days)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (name, lat, lon, opens, closes, slot_minutes, bays, closed_days))
+    invalidate_branch_cache()
+    click.echo(f"Added branch {name}.")
+
+@bp.cli.command("reroute-bookings")
+@click.option("--from", "date_from", default=lambda: date.today().isoformat(), help="First booking date (default: today).")
+@click.option("--to", "date_to", default="9999-12-31", help="Last booking date (default: no limit).")
+@click.option("--chunk", default=1000, show_default=True, help="Bookings per transaction.")
+@click.option("--fetch-missing", is_flag=True, help="Geocode postcodes that are not cached yet.")
+def reroute_bookings_command(date_from, date_to, chunk, fetch_missing):
+    """
+    Move bookings in a date range to the nearest branch with a free bay in
+    their slot. Bookings whose branch was picked by the customer or an admin,
+    and cancelled bookings, are left alone; so is any booking when no nearer
+    branch has room.
+    """
+    db = get_db()
+    cursor = (date_from, "", 0)
+    seen = moved = full = 0
+
+    # Walk the range in (date, booking_time, id) order, one chunk per
+    # transaction, so memory stays flat and the site keeps taking bookings.
+    while True:
+        rows = db.execute("""
+            SELECT id, date, booking_time, postcode, branch FROM bookings
+            WHERE (date, booking_time, id) > (?, ?, ?) AND date <= ? AND branch != ?
+              AND branch_chosen = 0 AND COALESCE(status, '') != 'CANCELLED'
+            ORDER BY date, booking_time, id
+            LIMIT ?
+        """, (*cursor, date_to, BRANCH_ASSIGNING, chunk)).fetchall()
+        if not rows:
+            break
+        cursor = (rows[-1]["date"], rows[-1]["booking_time"], rows[-1]["id"])
+        seen += len(rows)
+
+        postcodes = [normalise_postcode(row["postcode"] or "") for row in rows]
+        resolved = lookup_postcodes(postcodes, fetch=fetch_missing)
+        located = []
+        for row, postcode in zip(rows, postcodes):
+            coords = resolved.get(postcode) or (outcode_fallback(postcode) if postcode else None)
+            if coords and parse_booking_date(row["date"]):
+                located.append((row, coords))
+
+        # Bookings already at their nearest branch need no capacity check.
+        nearest = find_nearest_branches([coords for _, coords in located])
+        candidates = [
+            (row, coords) for (row, coords), (branch, _) in zip(located, nearest)
+            if branch["name"] != row["branch"]
+        ]
+
+        with transaction(db):
+            occupancy = {}
+            updates = []
+            for row, coords in candidates:
+                slot = row["booking_time"]
+                counts = occupancy.get((row["date"], slot))
+                if counts is None:
+                    counts = occupancy[(row["date"], slot)] = slot_occupancy(db, row["date"], slot)
+
+                target = first_free_branch(
+                    branches_by_distance(*coords), parse_booking_date(row["date"]), slot, counts,
+                    current=row["branch"]
+                )
+                if target is None:
+                    full += 1
+                    continue
+
+                branch, distance_km = target
+                counts[(slot, branch["name"])] = counts.get((slot, branch["name"]), 0) + 1
+                if row["branch"] != BRANCH_UNKNOWN:
+                    counts[(slot, row["branch"])] = counts.get((slot, row["branch"]), 0) - 1
+                updates.append((branch["name"], distance_km, row["id"]))
+
+            db.executemany("UPDATE bookings SET branch=?, branch_distance=? WHERE id=?", updates)
+        moved += len(updates)
+
+    click.echo(f"Checked {seen} bookings, moved {moved} to a nearer branch; "
+               f"{full} stayed put because nearer branches were full.")
+
+# Triggers that would otherwise fire once per imported row. A bulk import
+# drops them and the secondary indexes on bookings inside its transaction,
+# then recreates them and rebuilds what the triggers maintain in one pass each.
+IMPORT_SUSPENDED_TRIGGERS = ("bookings_fts_insert", "slot_occupancy_insert", "booking_stats_insert")
+
+@contextmanager
+def bulk_load(db):
+    """Suspend per-row index and trigger work on bookings. Call inside a transaction."""
+    saved = db.execute(f"""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name = 'bookings' AND sql IS NOT NULL
+          AND (type = 'index' OR name IN ({', '.join('?' * len(IMPORT_SUSPENDED_TRIGGERS))}))
+    """, IMPORT_SUSPENDED_TRIGGERS).fetchall()
+    for row in saved:
+        db.execute(f"DROP {row['type'].upper()} {row['name']}")
+
+    yield
+
+    for row in saved:
+        db.execute(row["sql"])
+    db.execute("INSERT INTO bookings_fts (bookings_fts) VALUES ('rebuild')")
+    db.execute("DELETE FROM slot_occupancy")
+    db.execute(f"INSERT INTO slot_occupancy (date, slot, branch, booked) {SLOT_OCCUPANCY_SQL}")
+    db.execute("DELETE FROM booking_stats")
+    db.execute(f"INSERT INTO booking_stats (date, branch, status, bookings) {BOOKING_STATS_SQL}")
+
+IMPORT_REQUIRED_FIELDS = ("name", "email", "vehicle", "make", "service", "date", "booking_time")
+TIME_PATTERN = re.compile(r"^([01]\d|2[0-3]):[0-5]\d(:[0-5]\d)?$")
+# branch_chosen as written by CSV (0/1) or NDJSON (true/false) exports.
+IMPORT_FLAGS = {"": 1, "1": 1, "true": 1, "0": 0, "false": 0}
+
+def _import_text(record, key):
+    value = record.get(key)
+    return "" if value is None else str(value).strip()
+
+def validate_import_record(record, branches):
+    """Return (insert values, None) for a valid record or (None, reason). branches maps name to branch."""
+    if not isinstance(record, dict):
+        return None, "not an object"
+    values = {key: str(record.get(key) or "").strip() for key in (
+        "name", "email", "vehicle", "make", "service", "notes", "date", "booking_time",
+        "postcode", "branch", "status"
+    )}
+
+    missing = [field for field in IMPORT_REQUIRED_FIELDS if not values[field]]
+    if missing:
+        return None, f"missing {', '.join(missing)}"
+    if "@" not in values["email"]:
+        return None, "invalid email"
+    if parse_booking_date(values["date"]) is None:
+        return None, "date must be YYYY-MM-DD"
+    if not TIME_PATTERN.match(values["booking_time"]):
+        return None, "booking_time must be HH:MM"
+
+    status = values["status"].upper() or "PENDING"
+    if status not in BOOKING_STATUSES:
+        return None, f"unknown status {values['status']!r}"
+
+    # Rows without a known branch are assigned afterwards by the batch
+    # geocoding pass rather than one lookup per row.
+    branch = branches.get(values["branch"])
+    distance_km, chosen = None, 0
+    if branch:
+        # Without a branch_chosen column (older exports, hand-made files) a
+        # named branch counts as chosen, so a reroute leaves it alone.
+        chosen = _import_text(record, "branch_chosen").lower()
+        if chosen not in IMPORT_FLAGS:
+            return None, "branch_chosen must be 0 or 1"
+        chosen = IMPORT_FLAGS[chosen]
+        distance = _import_text(record, "branch_distance")
+        if distance:
+            try:
+                distance_km = float(distance)
+            except ValueError:
+                return None, "branch_distance must be a number"
+    return (
+        values["name"], values["email"], values["vehicle"], values["make"], values["service"],
+        values["notes"], values["date"], values["booking_time"][:5], normalise_postcode(values["postcode"]),
+        branch["name"] if branch else BRANCH_ASSIGNING, distance_km, chosen, status
+    ), None
+
+def _read_import_file(f, import_format):
+    """Yield (line number, record) pairs from a CSV or NDJSON file."""
+    if import_format == "csv":
+        for line, record in enumerate(csv.DictReader(f), start=2):
+            yield line, record
+        return
+
+    for line, text in enumerate(f, start=1):
+        if not text.strip():
+            continue
+        try:
+            yield line, json.loads(text)
+        except ValueError:
+            yield line, None
+
+@bp.cli.command("import-bookings")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "import_format", type=click.Choice(["csv", "ndjson"]),
+              help="Defaults to the file extension.")
+@click.option("--chunk", default=5000, show_default=True, help="Rows per INSERT batch (per transaction with --online).")
+@click.option("--defer-assignment", is_flag=True,
+              help="Queue branch assignment instead of running it now; the running app's workers "
+                   "pick the jobs up (they start with its first request), or run assign-branches.")
+@click.option("--online", is_flag=True,
+              help="Commit every chunk and keep the per-row triggers, so the site can take bookings "
+                   "during the import. Much slower.")
+def import_bookings_command(path, import_format, chunk, defer_assignment, online):
+    """
+    Bulk-load bookings from a CSV or NDJSON export. By default the whole file
+    is one transaction: the bookings indexes and the search index,
+    slot_occupancy and booking_stats triggers are dropped for the load and
+    rebuilt once at the end, and other writers wait until it commits.
+    """
+    import_format = import_format or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+    db = get_db()
+    branches = {branch["name"]: branch for branch in get_branches()}
+    imported = 0
+    errors = []
+
+    def flush(batch):
+        with transaction(db):
+            last_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM bookings").fetchone()[0]
+            db.executemany("""
+                INSERT INTO bookings
+                (name, email, vehicle, make, service, notes, date, booking_time, postcode,
+                 branch, branch_distance, branch_chosen, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch)
+            db.execute(
+                "INSERT OR IGNORE INTO branch_jobs (booking_id, run_after) "
+                "SELECT id, ? FROM bookings WHERE id > ? AND branch = ?",
+                (time.time(), last_id, BRANCH_ASSIGNING)
+            )
+
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        f = stack.enter_context(open(path, newline="", encoding="utf-8"))
+        if not online:
+            stack.enter_context(transaction(db))
+            stack.enter_context(bulk_load(db))
+
+        batch = []
+        for line, record in _read_import_file(f, import_format):
+            values, error = (
+                validate_import_record(record, branches) if record is not None else (None, "invalid JSON")
+            )
+            if error:
+                errors.append((line, error))
+                continue
+            batch.append(values)
+            if len(batch) >= chunk:
+                flush(batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            flush(batch)
+            imported += len(batch)
+
+    click.echo(f"Imported {imported} bookings in {time.perf_counter() - start:.1f}s; skipped {len(errors)}.")
+    for line, error in errors[:20]:
+        click.echo(f"  line {line}: {error}")
+    if len(errors) > 20:
+        click.echo(f"  ... and {len(errors) - 20} more")
+
+    if not defer_assignment:
+        start = time.perf_counter()
+        drain_branch_jobs(db)
+        queued = db.execute("SELECT COUNT(*) FROM branch_jobs").fetchone()[0]
+        click.echo(f"Assigned branches in {time.perf_counter() - start:.1f}s; {queued} queued for retry.")
+
+@bp.cli.command("check-stats")
+@click.option("--rebuild", is_flag=True, help="Rebuild booking_stats from bookings if it has drifted.")
+def check_stats_command(rebuild):
+    """Compare booking_stats with a full count of bookings."""
+    db = get_db()
+    drift = db.execute(f"""
+        SELECT date, branch, status, SUM(counted) AS expected, SUM(stored) AS actual FROM (
+            SELECT date, branch, status, bookings AS counted, 0 AS stored FROM ({BOOKING_STATS_SQL})
+            UNION ALL
+            SELECT date, branch, status, 0, bookings FROM booking_stats
+        )
+        GROUP BY date, branch, status
+        HAVING SUM(counted) != SUM(stored)
+    """).fetchall()
+
+    if not drift:
+        click.echo("booking_stats is consistent with bookings.")
+        return
+
+    click.echo(f"{len(drift)} booking_stats rows differ from bookings:")
+    for row in drift[:20]:
+        click.echo(f"  {row['date']} {row['branch'] or '-'} {row['status'] or '-'}: "
+                   f"expected {row['expected']}, found {row['actual']}")
+
+    if rebuild:
+        with transaction(db):
+            db.execute("DELETE FROM booking_stats")
+            db.execute(f"INSERT INTO booking_stats (date, branch, status, bookings) {BOOKING_STATS_SQL}")
+        click.echo("booking_stats rebuilt.")
+
+@bp.cli.command("bench-search")
+@click.option("--rows", default=1_000_000, show_default=True, help="Synthetic bookings to generate.")
+@click.option("--term", "terms", multiple=True, help="Search text to time (default: one common, one rare term).")
+@click.option("--repeat", default=5, show_default=True, help="Timed runs per query.")
+def bench_search_command(rows, terms, repeat):
+    """Compare the FTS5 search against the old LIKE scan on a throwaway db."""
+    import random
+    import tempfile
+
+    first_names = ["james", "olivia", "amir", "chloe", "daniel", "fatima", "george", "priya", "liam", "sofia"]
+    last_names = ["smith", "jones", "patel", "khan", "brown", "taylor", "wilson", "davies", "evans", "ali"]
+    makes = ["BMW", "Audi", "Ford", "Honda", "Kia", "Vauxhall", "Nissan", "Peugeot"]
+    models = ["Focus", "A3", "Civic", "Corsa", "Qashqai", "Golf", "208", "Sportage"]
+    services = ["Full Service", "Oil Change", "MOT Test", "Brake Inspection", "Tyre Replacement"]
+    branches = ["Milton Keynes", "Wembley", "Luton"]
+    statuses = ["PENDING", "IN PROGRESS", "COMPLETED", "CANCELLED"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        init_db(path)
+        conn = sqlite3.connect(path)
+
+        start = time.perf_counter()
+        batch = []
+        for i in range(rows):
+            first, last = random.choice(first_names), random.choice(last_names)
+            batch.append((
+                f"{first.title()} {last.title()}", f"{first}.{last}{i}@example.com",
+                random.choice(models), random.choice(makes), random.choice(services), "",
+                f"2025-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+                f"{random.randint(8, 17):02d}:00", f"MK{random.randint(1, 19)}{random.randint(1, 9)}AB",
+                random.choice(branches), random.choice(statuses)
+            ))
+            if len(batch) == 10_000 or i == rows - 1:
+                conn.executemany("""
+                    INSERT INTO bookings
+                    (name, email, vehicle, make, service, notes, date, booking_time, postcode, branch, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, batch)
+                conn.commit()
+                batch = []
+        click.echo(f"Loaded {rows} bookings in {time.perf_counter() - start:.1f}s")
+
+        # The old dashboard path: seven LIKE scans, no ORDER BY, fetchall().
+        like_query = "SELECT * FROM bookings WHERE (" + " OR ".join(
+            f"LOWER({col}) LIKE ?" for col in ("name", "email", "vehicle", "make", "service", "postcode", "branch")
+        ) + ") AND status=?"
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        terms = terms or ("smith", c.execute("SELECT email FROM bookings ORDER BY random() LIMIT 1").fetchone()[0])
+
+        for term in terms:
+            timings = {}
+            like_params = [f"%{term.lower()}%"] * 7 + ["PENDING"]
+            for label, run in (
+                ("LIKE", lambda: c.execute(like_query, like_params).fetchall()),
+                ("FTS5", lambda: fetch_bookings_page(
+                    c, search_match_expression(term), ["status=?"], ["PENDING"], 50)[0]),
+            ):
+                best = float("inf")
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    run()
+                    best = min(best, time.perf_counter() - start)
+                timings[label] = best
+            click.echo(
+                f"{term!r}: LIKE {timings['LIKE'] * 1000:.1f} ms, FTS5 {timings['FTS5'] * 1000:.1f} ms "
+                f"({timings['LIKE'] / timings['FTS5']:.1f}x, best of {repeat})"
+            )
+
+        conn.close()
+
+@bp.cli.command("bench-startup")
+@click.option("--runs", default=5, show_default=True, help="Fresh interpreters to time.")
+def bench_startup_command(runs):
+    """Time a cold import of this module and the first request in new processes."""
+    import statistics
+    import subprocess
+    import sys
+    import tempfile
+
+    # The probe gets its own scratch database and no branch workers, so it
+    # never touches the real database and the timing leaves out thread start-up.
+    probe = (
+        "import sys, time; t0 = time.perf_counter()\n"
+        "import app\n"
+        "t1 = time.perf_counter()\n"
+        "client = app.create_app({'DATABASE': sys.argv[1], 'BRANCH_WORKERS': 0}).test_client()\n"
+        "client.get('/')\n"
+        "t2 = time.perf_counter()\n"
+        "print(t1 - t0, t2 - t0)\n"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    imports, first_requests = [], []
+    with tempfile.TemporaryDirectory() as scratch:
+        database = os.path.join(scratch, "bench.db")
+        for _ in range(runs):
+            out = subprocess.run(
+                [sys.executable, "-c", probe, database], cwd=here, capture_output=True, text=True, check=True
+            ).stdout.split()
+            imports.append(float(out[0]))
+            first_requests.append(float(out[1]))
+
+    click.echo(f"Cold import: median {statistics.median(imports) * 1000:.0f} ms over {runs} runs")
+    click.echo(f"Import to first response (GET /): median {statistics.median(first_requests) * 1000:.0f} ms")
+
+# -----------------------------
+# APP FACTORY
+# -----------------------------
+def create_app(config=None):
+    """
+    Build the Flask app. Cheap enough to call per worker and per test: no DDL
+    and no password hashing happen here. Run `flask --app app init-db` once to
+    create or upgrade the schema.
+    """
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+
+    GEOCODE_CACHE.maxsize = app.config["GEOCODE_MEMORY_SIZE"]
+    GEOCODE_CACHE.ttl = app.config["GEOCODE_MEMORY_TTL"]
+    app.extensions["branch_cache"] = _new_branch_cache()
+    app.extensions["branch_workers"] = _new_branch_workers()
+
+    app.before_request(_start_request_timer)
+    app.before_request(_start_branch_workers)
+    app.after_request(_record_request_time)
+    app.teardown_appcontext(close_db)
+    app.register_blueprint(bp)
+
+    if os.path.exists(app.config["DATABASE"]) and schema_version(app.config["DATABASE"]) < len(MIGRATIONS):
+        app.logger.warning("Database schema is out of date; run `flask --app app init-db`.")
+
+    return app
 
 if __name__ == "__main__":
+    app = create_app()
+    with app.app_context():
+        init_db()
+        seed_admin()
     app.run(debug=True)
@@ -59,8 +59,50 @@ document.addEventListener("DOMContentLoaded", function () {
 
     // TIME VALIDATION
     const timeField = document.getElementById("booking_time");
-    timeField.addEventListener("input", function () {
+    timeField.addEventListener("change", function () {
         validateField(timeField, timeField.value !== "");
     });
 
+    // AVAILABLE TIMES (refreshed whenever the date or branch changes)
+    const branchField = document.getElementById("branch");
+
+    function setTimeOptions(placeholder, slots) {
+        timeField.innerHTML = "";
+        const first = document.createElement("option");
+        first.value = "";
+        first.disabled = true;
+        first.selected = true;
+        first.textContent = placeholder;
+        timeField.appendChild(first);
+
+        slots.forEach(function (slot) {
+            const option = document.createElement("option");
+            option.value = slot.time;
+            option.disabled = slot.remaining < 1;
+            option.textContent = slot.remaining < 1 ? slot.time + " (fully booked)" : slot.time;
+            timeField.appendChild(option);
+        });
+    }
+
+    function loadAvailability() {
+        if (!dateField.value) {
+            setTimeOptions("Select a date first", []);
+            return;
+        }
+
+        const params = new URLSearchParams({ date: dateField.value, branch: branchField.value });
+        fetch(timeField.dataset.availabilityUrl + "?" + params)
+            .then(function (res) { return res.json(); })
+            .then(function (data) {
+                const slots = data.slots || [];
+                setTimeOptions(slots.length ? "Select a time" : "Closed on this date", slots);
+            })
+            .catch(function () {
+                setTimeOptions("Could not load times, please try again", []);
+            });
+    }
+
+    dateField.addEventListener("change", loadAvailability);
+    branchField.addEventListener("change", loadAvailability);
+
 });
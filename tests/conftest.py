@@ -0,0 +1,113 @@
+from datetime import date, timedelta
+
+import pytest
+import requests
+
+import app as app_module
+from app import create_app, init_db
+
+# Coordinates the fake postcodes.io knows about; anything else is a 404.
+KNOWN_POSTCODES = {
+    "MK58DA": (52.0205, -0.7926),
+    "HA90WS": (51.5560, -0.2796),
+    "LU13JU": (51.8798, -0.4175),
+}
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+
+class FakeGeocoder:
+    """Stands in for the postcodes.io session and records every call made to it."""
+
+    def __init__(self, known):
+        self.known = dict(known)
+        self.calls = []
+        self.error = None   # set to an exception to simulate an outage
+        self.failures = 0   # with error set: fail this many calls, then recover; 0 fails every call
+
+    def _maybe_fail(self):
+        if not self.error:
+            return
+        if self.failures:
+            self.failures -= 1
+            if not self.failures:
+                error, self.error = self.error, None
+                raise error
+        raise self.error
+
+    def get(self, url, timeout=None):
+        self.calls.append(("get", url))
+        self._maybe_fail()
+        postcode = url.rsplit("/", 1)[1]
+        if postcode not in self.known:
+            return FakeResponse(404, {"status": 404, "error": "Invalid postcode"})
+        lat, lon = self.known[postcode]
+        return FakeResponse(200, {"status": 200, "result": {"latitude": lat, "longitude": lon}})
+
+    def post(self, url, json=None, timeout=None):
+        self.calls.append(("post", url))
+        self._maybe_fail()
+        result = []
+        for query in json["postcodes"]:
+            coords = self.known.get(app_module.normalise_postcode(query))
+            result.append({
+                "query": query,
+                "result": {"latitude": coords[0], "longitude": coords[1]} if coords else None
+            })
+        return FakeResponse(200, {"status": 200, "result": result})
+
+
+@pytest.fixture(autouse=True)
+def geocoder(monkeypatch):
+    """Every test gets a fresh geocoder state and never reaches the network."""
+    fake = FakeGeocoder(KNOWN_POSTCODES)
+    monkeypatch.setattr(app_module, "get_http_session", lambda: fake)
+    monkeypatch.setattr(app_module, "GEOCODE_STATS", dict.fromkeys(app_module.GEOCODE_STATS, 0))
+    monkeypatch.setattr(app_module, "_upstream_down_until", 0.0)
+    app_module.GEOCODE_CACHE.clear()
+    return fake
+
+
+@pytest.fixture
+def app(tmp_path):
+    application = create_app({
+        "DATABASE": str(tmp_path / "test.db"),
+        "SECRET_KEY": "test",
+        "TESTING": True,
+        "BRANCH_WORKERS": 0,
+    })
+    with application.app_context():
+        init_db()
+    return application
+
+
+@pytest.fixture
+def open_day():
+    """The next date from tomorrow on which every seeded branch is open."""
+    day = date.today() + timedelta(days=1)
+    while day.weekday() in (5, 6):
+        day += timedelta(days=1)
+    return day
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as session:
+        session["admin_logged_in"] = True
+    return client
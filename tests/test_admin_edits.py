@@ -0,0 +1,158 @@
+import pytest
+
+import app as app_module
+from app import get_db, transaction
+
+EDIT_FIELDS = ("name", "email", "vehicle", "make", "service", "notes", "date", "booking_time", "postcode", "status")
+
+
+def add_booking(app, day, slot="10:00", branch="Milton Keynes", postcode="MK58DA", status="PENDING"):
+    with app.app_context(), transaction() as db:
+        return db.execute("""
+            INSERT INTO bookings (name, email, vehicle, make, service, notes, date, booking_time, postcode, branch, status)
+            VALUES ('Test Customer', 'test@example.com', 'Focus', 'Ford', 'MOT', '', ?, ?, ?, ?, ?)
+        """, (day.isoformat(), slot, postcode, branch, status)).lastrowid
+
+
+def get_booking(app, booking_id):
+    with app.app_context():
+        return dict(get_db().execute("SELECT * FROM bookings WHERE id=?", (booking_id,)).fetchone())
+
+
+def edit_form(app, booking_id, **changes):
+    booking = get_booking(app, booking_id)
+    form = {field: booking[field] or "" for field in EDIT_FIELDS}
+    form.update(changes)
+    return form
+
+
+def sql_counts():
+    metric = app_module.METRICS["sql"][0]
+    with metric._lock:
+        return {labels[0]: value[2] for labels, value in metric.series.items()}
+
+
+def statements_during(action):
+    """{statement fingerprint: times executed} for everything action runs."""
+    before = sql_counts()
+    action()
+    after = sql_counts()
+    return {sql: count - before.get(sql, 0) for sql, count in after.items() if count != before.get(sql, 0)}
+
+
+@pytest.fixture
+def warm_client(admin_client):
+    # The first request opens a pooled connection and runs its PRAGMAs; do it
+    # up front so the counts below only see the statements under test.
+    admin_client.get("/about")
+    return admin_client
+
+
+def test_status_only_edit_skips_geocoding_and_writes_one_column(app, warm_client, geocoder, open_day):
+    booking_id = add_booking(app, open_day)
+    form = edit_form(app, booking_id, status="COMPLETED")
+
+    statements = statements_during(lambda: warm_client.post(f"/admin/edit/{booking_id}", data=form))
+
+    assert geocoder.calls == []
+    assert statements == {
+        "SELECT * FROM bookings WHERE id=?": 1,
+        "BEGIN IMMEDIATE": 1,
+        "UPDATE bookings SET status=? WHERE id=?": 1,
+        "COMMIT": 1,
+    }
+    booking = get_booking(app, booking_id)
+    assert (booking["status"], booking["branch"]) == ("COMPLETED", "Milton Keynes")
+
+
+def test_noop_edit_only_reads_the_booking(app, warm_client, geocoder, open_day):
+    booking_id = add_booking(app, open_day)
+    form = edit_form(app, booking_id, postcode="mk5 8da")   # same postcode, different spelling
+
+    statements = statements_during(lambda: warm_client.post(f"/admin/edit/{booking_id}", data=form))
+
+    assert geocoder.calls == []
+    assert statements == {"SELECT * FROM bookings WHERE id=?": 1}
+
+
+def test_postcode_edit_picks_nearest_branch_with_a_free_bay(app, warm_client, geocoder, open_day):
+    for _ in range(3):   # Wembley has three bays
+        add_booking(app, open_day, branch="Wembley", postcode="HA90WS")
+    booking_id = add_booking(app, open_day)
+
+    warm_client.post(f"/admin/edit/{booking_id}", data=edit_form(app, booking_id, postcode="HA9 0WS"))
+
+    assert len(geocoder.calls) == 1
+    booking = get_booking(app, booking_id)
+    assert (booking["postcode"], booking["branch"]) == ("HA90WS", "Luton")
+    assert booking["branch_distance"] is not None
+
+
+def test_postcode_edit_keeps_the_bay_it_already_holds(app, warm_client, open_day):
+    for _ in range(2):
+        add_booking(app, open_day, branch="Wembley", postcode="HA90WS")
+    booking_id = add_booking(app, open_day, branch="Wembley", postcode="HA90WT")
+
+    warm_client.post(f"/admin/edit/{booking_id}", data=edit_form(app, booking_id, postcode="HA9 0WS"))
+
+    assert get_booking(app, booking_id)["branch"] == "Wembley"
+
+
+def test_bulk_status_change_is_one_executemany(app, warm_client, geocoder, open_day):
+    ids = [add_booking(app, open_day, slot=f"{8 + i % 10:02d}:00") for i in range(20)]
+
+    statements = statements_during(lambda: warm_client.post("/admin/bulk", data={
+        "action": "status", "new_status": "COMPLETED", "ids": [str(i) for i in ids]
+    }))
+
+    assert geocoder.calls == []
+    assert statements == {
+        "BEGIN IMMEDIATE": 1,
+        "UPDATE bookings SET status=? WHERE id=? AND status != ?": 1,
+        "COMMIT": 1,
+    }
+    assert {get_booking(app, i)["status"] for i in ids} == {"COMPLETED"}
+
+
+def test_bulk_branch_move_marks_the_choice_and_stays_offline(app, warm_client, geocoder, open_day):
+    ids = [add_booking(app, open_day) for _ in range(3)]
+
+    warm_client.post("/admin/bulk", data={"action": "branch", "new_branch": "Luton", "ids": [str(i) for i in ids]})
+
+    assert geocoder.calls == []
+    for booking_id in ids:
+        booking = get_booking(app, booking_id)
+        assert (booking["branch"], booking["branch_chosen"]) == ("Luton", 1)
+        assert booking["branch_distance"] is not None   # from the outcode table
+
+
+def test_bulk_delete_and_validation(app, warm_client, open_day):
+    ids = [add_booking(app, open_day) for _ in range(3)]
+
+    warm_client.post("/admin/bulk", data={"action": "status", "new_status": "NOPE", "ids": [str(ids[2])]})
+    warm_client.post("/admin/bulk", data={"action": "delete", "ids": [str(i) for i in ids[:2]]})
+
+    assert get_booking(app, ids[2])["status"] == "PENDING"
+    with app.app_context():
+        remaining = [row["id"] for row in get_db().execute("SELECT id FROM bookings")]
+    assert remaining == [ids[2]]
+
+
+def test_bulk_actions_require_login(app, client, open_day):
+    booking_id = add_booking(app, open_day)
+
+    response = client.post("/admin/bulk", data={"action": "delete", "ids": [str(booking_id)]})
+
+    assert response.location.endswith("/login")
+    assert get_booking(app, booking_id)["id"] == booking_id
+
+
+def test_edit_and_delete_require_login(app, client, open_day):
+    booking_id = add_booking(app, open_day)
+
+    edit = client.post(f"/admin/edit/{booking_id}", data=edit_form(app, booking_id, status="CANCELLED"))
+    delete = client.post(f"/admin/delete/{booking_id}")
+
+    assert edit.location.endswith("/login")
+    assert delete.location.endswith("/login")
+    assert get_booking(app, booking_id)["status"] == "PENDING"
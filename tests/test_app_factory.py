@@ -0,0 +1,54 @@
+import time
+
+from app import create_app, get_db, init_db, seed_admin
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def make_app(path):
+    application = create_app({
+        "DATABASE": str(path), "SECRET_KEY": "test", "TESTING": True,
+        "BRANCH_WORKERS": 1, "BRANCH_POLL_INTERVAL": 0.05,
+    })
+    with application.app_context():
+        init_db()
+    return application
+
+
+def branch_of_first_booking(application):
+    with application.app_context():
+        row = get_db().execute("SELECT branch FROM bookings ORDER BY id LIMIT 1").fetchone()
+        return row["branch"] if row else None
+
+
+def test_each_app_gets_its_own_branch_workers(tmp_path, open_day):
+    apps = [make_app(tmp_path / "one.db"), make_app(tmp_path / "two.db")]
+
+    for application in apps:
+        application.test_client().post("/book", data={
+            "name": "Test Customer", "email": "test@example.com", "vehicle": "Focus", "make": "Ford",
+            "service": "MOT", "notes": "", "date": open_day.isoformat(), "booking_time": "10:00",
+            "postcode": "MK5 8DA",
+        })
+
+    for application in apps:
+        assert wait_for(lambda: branch_of_first_booking(application) == "Milton Keynes")
+    assert apps[0].extensions["branch_workers"] is not apps[1].extensions["branch_workers"]
+
+
+def test_default_admin_is_seeded_once(app):
+    with app.app_context():
+        assert seed_admin() is True
+        assert seed_admin() is False
+
+    response = app.test_client().post("/login", data={"email": "admin@a1autocare.com", "password": "admin123"})
+
+    assert response.status_code == 302
+    assert response.location.endswith("/admin/dashboard")
@@ -0,0 +1,123 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app import get_db, transaction
+
+
+def booking_form(day, slot="10:00", branch="Luton"):
+    return {
+        "name": "Test Customer", "email": "test@example.com", "vehicle": "Focus", "make": "Ford",
+        "service": "MOT", "notes": "", "date": day.isoformat(), "booking_time": slot,
+        "postcode": "LU1 3JU", "branch": branch,
+    }
+
+
+def add_booking(app, day, slot="10:00", branch="Luton"):
+    with app.app_context(), transaction() as db:
+        return db.execute("""
+            INSERT INTO bookings (name, email, vehicle, make, service, date, booking_time, postcode, branch, status)
+            VALUES ('Test Customer', 'test@example.com', 'Focus', 'Ford', 'MOT', ?, ?, 'LU13JU', ?, 'PENDING')
+        """, (day.isoformat(), slot, branch)).lastrowid
+
+
+def remaining(client, day, branch=""):
+    response = client.get(f"/api/availability?date={day.isoformat()}&branch={branch}")
+    assert response.status_code == 200
+    return {slot["time"]: slot["remaining"] for slot in response.get_json()["slots"]}
+
+
+def flashes(client):
+    with client.session_transaction() as session:
+        return [message for _, message in session.pop("_flashes", [])]
+
+
+def booking_count(app):
+    with app.app_context():
+        return get_db().execute("SELECT COUNT(*) FROM bookings").fetchone()[0]
+
+
+@pytest.fixture
+def saturday():
+    day = date.today() + timedelta(days=1)
+    while day.weekday() != 5:
+        day += timedelta(days=1)
+    return day
+
+
+def test_closed_branch_has_no_slots_and_takes_no_bookings(app, client, saturday):
+    assert remaining(client, saturday, "Luton") == {}
+    assert remaining(client, saturday)["10:00"] == 7   # Milton Keynes and Wembley only
+
+    client.post("/book", data=booking_form(saturday))
+
+    assert flashes(client) == ["Sorry, that time isn't bookable. Please pick one of the available slots."]
+    assert booking_count(app) == 0
+
+
+def test_time_off_the_slot_grid_is_rejected(app, client, open_day):
+    client.post("/book", data=booking_form(open_day, slot="10:30"))
+
+    assert flashes(client) == ["Sorry, that time isn't bookable. Please pick one of the available slots."]
+    assert booking_count(app) == 0
+
+
+def test_past_date_is_rejected(app, client):
+    client.post("/book", data=booking_form(date.today() - timedelta(days=1)))
+
+    assert flashes(client) == ["Please choose a date that is not in the past."]
+    assert booking_count(app) == 0
+
+
+def test_bad_requests_to_the_availability_api(client, open_day):
+    assert client.get(f"/api/availability?date={open_day.isoformat()}&branch=Leeds").status_code == 404
+    assert client.get("/api/availability?date=tomorrow").status_code == 400
+
+
+def test_full_slot_suggests_other_times_and_branches(app, client, open_day):
+    for _ in range(2):   # Luton has two bays
+        add_booking(app, open_day)
+
+    client.post("/book", data=booking_form(open_day))
+
+    assert flashes(client) == [
+        f"Sorry, 10:00 on {open_day.isoformat()} is fully booked at Luton. "
+        "Free times that day: 09:00, 11:00, 12:00. Also free at 10:00: Milton Keynes, Wembley."
+    ]
+    assert booking_count(app) == 2
+
+
+def test_assigning_bookings_use_up_the_combined_capacity(app, client, open_day):
+    for _ in range(8):
+        add_booking(app, open_day, branch="ASSIGNING")
+
+    assert remaining(client, open_day)["10:00"] == 1
+    assert remaining(client, open_day, "Luton")["10:00"] == 1   # every branch shares the last bay
+
+    add_booking(app, open_day, branch="ASSIGNING")
+    assert remaining(client, open_day)["10:00"] == 0
+    assert remaining(client, open_day, "Milton Keynes")["10:00"] == 0
+
+    client.post("/book", data=booking_form(open_day, branch=""))
+    assert flashes(client)[0].startswith(f"Sorry, 10:00 on {open_day.isoformat()} is fully booked.")
+    assert booking_count(app) == 9
+
+
+def test_edits_deletes_and_cancellations_free_the_bay(app, admin_client, open_day):
+    first, second = add_booking(app, open_day), add_booking(app, open_day)
+    assert remaining(admin_client, open_day, "Luton")["10:00"] == 0
+
+    admin_client.post("/admin/bulk", data={"action": "status", "new_status": "CANCELLED", "ids": [str(first)]})
+    assert remaining(admin_client, open_day, "Luton")["10:00"] == 1
+
+    with app.app_context():
+        booking = dict(get_db().execute("SELECT * FROM bookings WHERE id=?", (second,)).fetchone())
+    form = {field: booking[field] or "" for field in (
+        "name", "email", "vehicle", "make", "service", "notes", "date", "postcode", "status"
+    )}
+    admin_client.post(f"/admin/edit/{second}", data={**form, "booking_time": "11:00"})
+    luton = remaining(admin_client, open_day, "Luton")
+    assert (luton["10:00"], luton["11:00"]) == (2, 1)
+
+    admin_client.post(f"/admin/delete/{second}")
+    assert remaining(admin_client, open_day, "Luton")["11:00"] == 2
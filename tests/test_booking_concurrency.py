@@ -0,0 +1,74 @@
+import sqlite3
+import threading
+
+THREADS = 16
+
+
+def booking_form(day, slot, **overrides):
+    form = {
+        "name": "Test Customer", "email": "test@example.com", "vehicle": "Focus", "make": "Ford",
+        "service": "MOT", "notes": "", "date": day.isoformat(), "booking_time": slot,
+        "postcode": "MK5 8DA", "branch": "Milton Keynes",
+    }
+    form.update(overrides)
+    return form
+
+
+def run_concurrently(app, forms_per_thread):
+    """POST every thread's forms to /book at once; returns (responses, exceptions)."""
+    barrier = threading.Barrier(len(forms_per_thread))
+    responses, errors = [], []
+    lock = threading.Lock()
+
+    def worker(forms):
+        client = app.test_client()
+        barrier.wait()
+        for form in forms:
+            try:
+                response = client.post("/book", data=form)
+            except Exception as exc:   # TESTING propagates errors out of the view
+                with lock:
+                    errors.append(exc)
+                continue
+            with lock:
+                responses.append(response)
+
+    threads = [threading.Thread(target=worker, args=(forms,)) for forms in forms_per_thread]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses, errors
+
+
+def booking_count(app):
+    conn = sqlite3.connect(app.config["DATABASE"])
+    try:
+        return conn.execute("SELECT COUNT(*) FROM bookings").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_concurrent_bookings_are_all_saved(app, open_day):
+    slots = [f"{hour:02d}:00" for hour in range(8, 18)]   # Milton Keynes: 10 slots x 4 bays
+    forms = [
+        [booking_form(open_day, slots[(thread * 2 + i) % len(slots)]) for i in range(2)]
+        for thread in range(THREADS)
+    ]
+
+    responses, errors = run_concurrently(app, forms)
+
+    assert errors == []
+    assert all(r.status_code == 302 and r.location.endswith("/confirm") for r in responses)
+    assert booking_count(app) == THREADS * 2
+
+
+def test_last_bays_are_not_double_booked(app, open_day):
+    forms = [[booking_form(open_day, "10:00")] for _ in range(THREADS)]
+
+    responses, errors = run_concurrently(app, forms)
+
+    assert errors == []
+    confirmed = [r for r in responses if r.location.endswith("/confirm")]
+    assert len(confirmed) == 4   # Milton Keynes has four bays
+    assert booking_count(app) == 4
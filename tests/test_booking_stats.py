@@ -0,0 +1,82 @@
+from app import BOOKING_STATS_SQL, drain_branch_jobs, enqueue_branch_jobs, get_db, transaction
+
+
+def add_booking(app, day, branch="Milton Keynes", status="PENDING", slot="10:00", postcode="MK58DA"):
+    with app.app_context(), transaction() as db:
+        return db.execute("""
+            INSERT INTO bookings (name, email, vehicle, make, service, date, booking_time, postcode, branch, status)
+            VALUES ('Test Customer', 'test@example.com', 'Focus', 'Ford', 'MOT', ?, ?, ?, ?, ?)
+        """, (day.isoformat(), slot, postcode, branch, status)).lastrowid
+
+
+def stored_stats(app):
+    with app.app_context():
+        return {tuple(row) for row in get_db().execute(
+            "SELECT date, branch, status, bookings FROM booking_stats WHERE bookings > 0"
+        )}
+
+
+def counted_stats(app):
+    with app.app_context():
+        return {tuple(row) for row in get_db().execute(BOOKING_STATS_SQL)}
+
+
+def edit(app, client, booking_id, **changes):
+    with app.app_context():
+        booking = dict(get_db().execute("SELECT * FROM bookings WHERE id=?", (booking_id,)).fetchone())
+    form = {field: booking[field] or "" for field in (
+        "name", "email", "vehicle", "make", "service", "notes", "date", "booking_time", "postcode", "status"
+    )}
+    client.post(f"/admin/edit/{booking_id}", data={**form, **changes})
+
+
+def test_stats_follow_edits_bulk_changes_and_deletes(app, admin_client, open_day):
+    ids = [add_booking(app, open_day, slot=f"{9 + i:02d}:00") for i in range(6)]
+    day = open_day.isoformat()
+    assert stored_stats(app) == {(day, "Milton Keynes", "PENDING", 6)}
+
+    edit(app, admin_client, ids[0], status="COMPLETED")
+    edit(app, admin_client, ids[1], postcode="HA9 0WS")   # moves to Wembley
+    admin_client.post("/admin/bulk", data={"action": "status", "new_status": "CANCELLED",
+                                           "ids": [str(i) for i in ids[2:4]]})
+    admin_client.post("/admin/bulk", data={"action": "branch", "new_branch": "Luton", "ids": [str(ids[4])]})
+    admin_client.post(f"/admin/delete/{ids[5]}")
+
+    assert stored_stats(app) == counted_stats(app) == {
+        (day, "Milton Keynes", "COMPLETED", 1),
+        (day, "Wembley", "PENDING", 1),
+        (day, "Milton Keynes", "CANCELLED", 2),
+        (day, "Luton", "PENDING", 1),
+    }
+
+    admin_client.post("/admin/bulk", data={"action": "delete", "ids": [str(i) for i in ids[:5]]})
+    assert stored_stats(app) == counted_stats(app) == set()
+
+
+def test_stats_follow_background_assignment(app, open_day):
+    booking_id = add_booking(app, open_day, branch="ASSIGNING", postcode="HA90WS")
+    with app.app_context():
+        with transaction() as db:
+            enqueue_branch_jobs(db, [booking_id])
+        drain_branch_jobs(get_db())
+
+    assert stored_stats(app) == counted_stats(app) == {(open_day.isoformat(), "Wembley", "PENDING", 1)}
+
+
+def test_check_stats_reports_and_repairs_drift(app, open_day):
+    add_booking(app, open_day)
+    add_booking(app, open_day, status="COMPLETED")
+    with app.app_context(), transaction() as db:
+        db.execute("UPDATE booking_stats SET bookings = 5 WHERE status='PENDING'")
+        db.execute("DELETE FROM booking_stats WHERE status='COMPLETED'")
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=["check-stats"])
+    assert "2 booking_stats rows differ from bookings:" in result.output
+    assert f"{open_day.isoformat()} Milton Keynes PENDING: expected 1, found 5" in result.output
+    assert stored_stats(app) != counted_stats(app)
+
+    result = runner.invoke(args=["check-stats", "--rebuild"])
+    assert "booking_stats rebuilt." in result.output
+    assert stored_stats(app) == counted_stats(app)
+    assert runner.invoke(args=["check-stats"]).output == "booking_stats is consistent with bookings.\n"
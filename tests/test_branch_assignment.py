@@ -0,0 +1,105 @@
+import time
+
+import requests
+
+import app as app_module
+from app import create_app, drain_branch_jobs, get_db, init_db, process_branch_jobs, transaction
+
+
+def book(client, day, slot="10:00", postcode="MK5 8DA"):
+    return client.post("/book", data={
+        "name": "Test Customer", "email": "test@example.com", "vehicle": "Focus", "make": "Ford",
+        "service": "MOT", "notes": "", "date": day.isoformat(), "booking_time": slot, "postcode": postcode,
+    })
+
+
+def branches(app):
+    with app.app_context():
+        return [row["branch"] for row in get_db().execute("SELECT branch FROM bookings ORDER BY id")]
+
+
+def assigned_branches(app):
+    with app.app_context():
+        drain_branch_jobs(get_db())
+    return branches(app)
+
+
+def test_booking_without_a_branch_is_assigned_in_the_background(app, client, geocoder, open_day):
+    response = book(client, open_day)
+
+    assert response.location.endswith("/confirm")
+    with app.app_context():
+        assert get_db().execute("SELECT branch FROM bookings").fetchone()["branch"] == "ASSIGNING"
+    assert assigned_branches(app) == ["Milton Keynes"]
+    assert [method for method, _ in geocoder.calls] == ["post"]
+
+
+def test_full_nearest_branch_sends_the_booking_to_the_next_one(app, client, open_day):
+    for _ in range(4):   # Milton Keynes has four bays
+        book(client, open_day)
+    book(client, open_day)
+
+    assert assigned_branches(app) == ["Milton Keynes"] * 4 + ["Luton"]
+
+
+def test_queued_jobs_are_picked_up_after_a_restart(tmp_path, open_day):
+    application = create_app({
+        "DATABASE": str(tmp_path / "restart.db"), "SECRET_KEY": "test", "TESTING": True,
+        "BRANCH_WORKERS": 1, "BRANCH_POLL_INTERVAL": 60,
+    })
+    with application.app_context():
+        init_db()
+        with transaction() as db:
+            booking_id = db.execute("""
+                INSERT INTO bookings (name, email, vehicle, make, service, date, booking_time, postcode, branch, status)
+                VALUES ('Test Customer', 'test@example.com', 'Focus', 'Ford', 'MOT', ?, '10:00', 'LU13JU', 'ASSIGNING', 'PENDING')
+            """, (open_day.isoformat(),)).lastrowid
+            db.execute("INSERT INTO branch_jobs (booking_id, run_after) VALUES (?, ?)", (booking_id, time.time()))
+
+    # Any request starts the workers, and a fresh worker drains the queue
+    # straight away rather than after BRANCH_POLL_INTERVAL.
+    application.test_client().get("/about")
+
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and branches(application) != ["Luton"]:
+        time.sleep(0.02)
+    assert branches(application) == ["Luton"]
+
+
+def job_attempts(app):
+    with app.app_context():
+        return [row["attempts"] for row in get_db().execute("SELECT attempts FROM branch_jobs ORDER BY id")]
+
+
+def test_an_upstream_outage_costs_one_attempt_not_the_retry_budget(app, client, geocoder, monkeypatch, open_day):
+    for postcode in ("MK5 8DA", "HA9 0WS", "LU1 3JU"):
+        book(client, open_day, postcode=postcode)
+    geocoder.error, geocoder.failures = requests.ConnectionError("refused"), 1
+
+    # The failed pass queues every job for a retry and the drain stops there.
+    assert assigned_branches(app) == ["ASSIGNING"] * 3
+    assert job_attempts(app) == [1, 1, 1]
+
+    # During the cooldown nothing reaches postcodes.io and no attempt is spent.
+    assert assigned_branches(app) == ["ASSIGNING"] * 3
+    assert job_attempts(app) == [1, 1, 1]
+    assert len(geocoder.calls) == 1
+
+    monkeypatch.setattr(app_module, "_upstream_down_until", 0.0)
+    assert assigned_branches(app) == ["Milton Keynes", "Wembley", "Luton"]
+    assert job_attempts(app) == []
+    assert len(geocoder.calls) == 2
+
+
+
+def test_idle_poll_does_not_take_the_write_lock(app):
+    metric = app_module.METRICS["sql"][0]
+
+    def begins():
+        with metric._lock:
+            return metric.series.get(("BEGIN IMMEDIATE",), [None, 0, 0])[2]
+
+    with app.app_context():
+        before = begins()
+        assert process_branch_jobs(get_db()) == 0
+        assert begins() == before
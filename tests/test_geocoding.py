@@ -0,0 +1,107 @@
+import requests
+
+import app as app_module
+from app import get_coordinates_from_postcode, geocode_stats, get_db, lookup_postcodes, outcode_fallback
+
+
+def cached_rows(app):
+    with app.app_context():
+        return {row["postcode"]: row["latitude"] for row in get_db().execute("SELECT * FROM postcode_cache")}
+
+
+def test_memory_hit_skips_db_and_upstream(app, geocoder):
+    with app.app_context():
+        first = get_coordinates_from_postcode("mk5 8da")
+        second = get_coordinates_from_postcode("MK5 8DA")
+
+    assert first == second == (52.0205, -0.7926)
+    assert len(geocoder.calls) == 1
+    stats = geocode_stats()
+    assert stats["memory_hits"] == 1
+    assert stats["upstream_calls"] == 1
+
+
+def test_db_hit_after_memory_is_cleared(app, geocoder):
+    with app.app_context():
+        get_coordinates_from_postcode("HA9 0WS")
+        app_module.GEOCODE_CACHE.clear()
+        coords = get_coordinates_from_postcode("HA9 0WS")
+
+    assert coords == (51.5560, -0.2796)
+    assert len(geocoder.calls) == 1
+    assert geocode_stats()["db_hits"] == 1
+    assert cached_rows(app) == {"HA90WS": 51.5560}
+
+
+def test_invalid_postcode_is_negatively_cached(app, geocoder):
+    with app.app_context():
+        assert get_coordinates_from_postcode("ZZ9 9ZZ") is None
+        assert get_coordinates_from_postcode("ZZ9 9ZZ") is None
+
+    assert len(geocoder.calls) == 1
+    assert cached_rows(app) == {"ZZ99ZZ": None}
+    stats = geocode_stats()
+    assert stats["memory_hits"] == 1
+    assert stats["unresolved"] == 2
+    assert stats["upstream_errors"] == 0
+
+
+def test_upstream_timeout_falls_back_to_outcode(app, geocoder):
+    geocoder.error = requests.Timeout("read timed out")
+
+    with app.app_context():
+        coords = get_coordinates_from_postcode("MK5 8DA")
+        again = get_coordinates_from_postcode("MK5 8DA")
+
+    assert coords == again == outcode_fallback("MK58DA")
+    # The failure is not cached, and the cooldown stops the second lookup
+    # from waiting on the same outage.
+    assert cached_rows(app) == {}
+    assert len(geocoder.calls) == 1
+    stats = geocode_stats()
+    assert stats["upstream_errors"] == 1
+    assert stats["upstream_skipped"] == 1
+    assert stats["fallback_hits"] == 2
+
+
+def test_upstream_retried_after_cooldown(app, geocoder, monkeypatch):
+    geocoder.error = requests.ConnectionError("refused")
+    with app.app_context():
+        get_coordinates_from_postcode("LU1 3JU")
+
+    geocoder.error = None
+    monkeypatch.setattr(app_module, "_upstream_down_until", 0.0)
+    with app.app_context():
+        assert get_coordinates_from_postcode("LU1 3JU") == (51.8798, -0.4175)
+    assert len(geocoder.calls) == 2
+
+
+def test_bulk_lookup_uses_one_request_and_the_caches(app, geocoder):
+    with app.app_context():
+        get_coordinates_from_postcode("MK5 8DA")
+        results = lookup_postcodes(["MK5 8DA", "HA9 0WS", "LU1 3JU", "ZZ9 9ZZ"])
+
+    assert results == {
+        "MK58DA": (52.0205, -0.7926),
+        "HA90WS": (51.5560, -0.2796),
+        "LU13JU": (51.8798, -0.4175),
+        "ZZ99ZZ": None,
+    }
+    assert [method for method, _ in geocoder.calls] == ["get", "post"]
+    assert set(cached_rows(app)) == {"MK58DA", "HA90WS", "LU13JU", "ZZ99ZZ"}
+
+
+def test_bulk_lookup_without_fetch_stays_offline(app, geocoder):
+    with app.app_context():
+        assert lookup_postcodes(["MK5 8DA"], fetch=False) == {}
+    assert geocoder.calls == []
+
+
+def test_geocode_stats_view(app, admin_client):
+    with app.app_context():
+        get_coordinates_from_postcode("MK5 8DA")
+    response = admin_client.get("/admin/geocode-stats")
+
+    assert response.status_code == 200
+    assert response.get_json() == {**dict.fromkeys(app_module.GEOCODE_STATS, 0),
+                                   "memory_misses": 1, "db_misses": 1, "upstream_calls": 1}
@@ -0,0 +1,110 @@
+import csv
+import json
+
+import pytest
+
+import app as app_module
+from app import BOOKING_STATS_SQL, SLOT_OCCUPANCY_SQL, get_db
+
+FIELDS = ["name", "email", "vehicle", "make", "service", "notes", "date", "booking_time", "postcode", "branch", "status"]
+
+
+@pytest.fixture
+def import_file(tmp_path, open_day):
+    path = tmp_path / "bookings.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for i in range(300):
+            writer.writerow([f"Customer {i}", f"c{i}@example.com", "Focus", "Ford", "MOT", "",
+                             open_day.isoformat(), f"{9 + i % 8:02d}:00", "MK5 8DA",
+                             ["Milton Keynes", "Wembley", "Luton", ""][i % 4], "PENDING"])
+        writer.writerow(["Bad Row", "not-an-email", "Focus", "Ford", "MOT", "", open_day.isoformat(),
+                         "10:00", "MK5 8DA", "", "PENDING"])
+    return str(path)
+
+
+def schema_objects(db):
+    return db.execute("SELECT type, name FROM sqlite_master WHERE tbl_name='bookings' ORDER BY name").fetchall()
+
+
+def rows(db, sql):
+    return {tuple(row) for row in db.execute(sql)}
+
+
+@pytest.mark.parametrize("online", [False, True])
+def test_import_keeps_derived_tables_in_step(app, import_file, online):
+    with app.app_context():
+        before = [tuple(row) for row in schema_objects(get_db())]
+
+    args = ["import-bookings", import_file, "--defer-assignment", "--chunk", "64"]
+    result = app.test_cli_runner().invoke(args=args + (["--online"] if online else []))
+
+    assert result.exit_code == 0, result.output
+    assert "Imported 300 bookings" in result.output
+    assert "skipped 1" in result.output
+    with app.app_context():
+        db = get_db()
+        assert [tuple(row) for row in schema_objects(db)] == before
+        assert rows(db, SLOT_OCCUPANCY_SQL) == rows(db, "SELECT date, slot, branch, booked FROM slot_occupancy")
+        assert rows(db, BOOKING_STATS_SQL) == rows(db, "SELECT date, branch, status, bookings FROM booking_stats")
+        assert db.execute("SELECT COUNT(*) FROM bookings_fts WHERE bookings_fts MATCH 'c123'").fetchone()[0] == 1
+        assert db.execute("SELECT COUNT(*) FROM branch_jobs").fetchone()[0] == 75
+
+
+def test_failed_import_rolls_back_rows_and_schema(app, import_file, monkeypatch):
+    calls = []
+    validate = app_module.validate_import_record
+
+    def failing_validate(record, branches):
+        calls.append(record)
+        if len(calls) == 200:
+            raise RuntimeError("disk full")
+        return validate(record, branches)
+
+    monkeypatch.setattr(app_module, "validate_import_record", failing_validate)
+    with app.app_context():
+        before = [tuple(row) for row in schema_objects(get_db())]
+
+    result = app.test_cli_runner().invoke(args=["import-bookings", import_file, "--chunk", "64"])
+
+    assert isinstance(result.exception, RuntimeError)
+    with app.app_context():
+        db = get_db()
+        assert db.execute("SELECT COUNT(*) FROM bookings").fetchone()[0] == 0
+        assert [tuple(row) for row in schema_objects(db)] == before
+
+
+def import_records(app, tmp_path, records):
+    path = tmp_path / "bookings.ndjson"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    result = app.test_cli_runner().invoke(args=["import-bookings", str(path), "--defer-assignment"])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_export_and_import_keep_how_the_branch_was_set(app, admin_client, tmp_path, open_day):
+    booking = {"name": "Test Customer", "email": "test@example.com", "vehicle": "Focus", "make": "Ford",
+               "service": "MOT", "date": open_day.isoformat(), "booking_time": "10:00", "postcode": "MK5 8DA"}
+    output = import_records(app, tmp_path, [
+        {**booking, "branch": "Wembley"},                                                 # older export
+        {**booking, "branch": "Luton", "branch_distance": 21.5, "branch_chosen": False},  # assigned
+        {**booking, "branch": "Luton", "branch_chosen": "maybe"},
+    ])
+    assert "Imported 2 bookings" in output
+    assert "branch_chosen must be 0 or 1" in output
+
+    exported = [json.loads(line) for line in
+                admin_client.get("/admin/export?format=ndjson").get_data(as_text=True).splitlines()]
+    assert sorted((row["branch"], row["branch_distance"], row["branch_chosen"]) for row in exported) == [
+        ("Luton", 21.5, 0), ("Wembley", None, 1)
+    ]
+
+    # Loading the export back gives the same rows.
+    with app.app_context():
+        get_db().execute("DELETE FROM bookings")
+    import_records(app, tmp_path, exported)
+    with app.app_context():
+        assert rows(get_db(), "SELECT branch, branch_distance, branch_chosen FROM bookings") == {
+            ("Luton", 21.5, 0), ("Wembley", None, 1)
+        }
@@ -0,0 +1,82 @@
+import logging
+
+import app as app_module
+from app import get_db, transaction
+
+
+def series_value(name, statement):
+    metric = app_module.METRICS[name][0]
+    with metric._lock:
+        value = metric.series.get((statement,), 0)
+    return value[2] if metric.kind == "histogram" and value else value
+
+
+def test_metrics_accept_a_session_or_the_bearer_token(app, admin_client):
+    app.config["METRICS_TOKEN"] = "s3cret"
+
+    assert admin_client.get("/admin/metrics").status_code == 200
+    anonymous = app.test_client()
+    assert anonymous.get("/admin/metrics").status_code == 401
+    assert anonymous.get("/admin/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert anonymous.get("/admin/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
+
+
+def test_metrics_without_a_token_configured_need_a_session(app):
+    response = app.test_client().get("/admin/metrics", headers={"Authorization": "Bearer "})
+
+    assert response.status_code == 401
+
+
+def test_metrics_are_prometheus_text(app, admin_client):
+    admin_client.get("/about")
+
+    response = admin_client.get("/admin/metrics")
+
+    assert response.mimetype == "text/plain"
+    lines = response.get_data(as_text=True).splitlines()
+    assert "# TYPE a1_request_duration_seconds histogram" in lines
+    assert "# TYPE a1_sql_rows_total counter" in lines
+    about = [line for line in lines if 'endpoint="main.about"' in line]
+    assert any('le="+Inf"' in line for line in about)
+    assert any(line.startswith("a1_request_duration_seconds_count{") for line in about)
+    assert 'a1_geocode_events_total{event="upstream_calls"} 0' in lines
+    for line in lines:
+        if not line.startswith("#"):
+            float(line.rsplit(" ", 1)[1])   # every sample ends in a number
+
+
+def test_rows_are_counted_once_per_cursor(app):
+    statement = "SELECT id FROM metric_probe"
+    with app.app_context():
+        db = get_db()
+        db.execute("CREATE TABLE metric_probe (id INTEGER)")
+        db.executemany("INSERT INTO metric_probe VALUES (?)", [(i,) for i in range(50)])
+        before = series_value("sql_rows", statement)
+
+        cursor = db.execute(statement)
+        assert len(list(cursor)) == 50
+        assert series_value("sql_rows", statement) == before + 50
+
+        cursor = db.execute(statement)
+        cursor.fetchmany(10)
+        assert series_value("sql_rows", statement) == before + 50   # still being read
+        cursor.close()
+        assert series_value("sql_rows", statement) == before + 60
+
+
+def test_slow_queries_are_logged_but_transaction_control_is_not(app, caplog):
+    app.config["SLOW_QUERY_MS"] = 0   # read when the connection is opened
+    statements = ("SELECT COUNT(*) FROM bookings", "BEGIN IMMEDIATE", "COMMIT")
+    before = {sql: series_value("sql_slow", sql) for sql in statements}
+
+    with caplog.at_level(logging.WARNING), app.app_context():
+        get_db().execute("SELECT COUNT(*) FROM bookings").fetchone()
+        with transaction():
+            pass
+
+    slow = [record.getMessage() for record in caplog.records if record.getMessage().startswith("Slow query")]
+    assert any(message.endswith("SELECT COUNT(*) FROM bookings") for message in slow)
+    assert not any("BEGIN" in message or "COMMIT" in message for message in slow)
+    assert series_value("sql_slow", "SELECT COUNT(*) FROM bookings") == before["SELECT COUNT(*) FROM bookings"] + 1
+    assert series_value("sql_slow", "BEGIN IMMEDIATE") == before["BEGIN IMMEDIATE"]
+    assert series_value("sql_slow", "COMMIT") == before["COMMIT"]
@@ -0,0 +1,71 @@
+import pytest
+
+from app import fetch_bookings_page, get_db, search_match_expression, transaction
+
+
+@pytest.fixture
+def bookings(app, open_day):
+    """23 bookings over two days and three slots, so many share (date, booking_time)."""
+    rows = [
+        (open_day.isoformat() if i % 2 else open_day.replace(day=1).isoformat(), f"{9 + i % 3:02d}:00")
+        for i in range(23)
+    ]
+    with app.app_context(), transaction() as db:
+        db.executemany("""
+            INSERT INTO bookings (name, email, vehicle, make, service, date, booking_time, postcode, branch, status)
+            VALUES ('Test Customer', 'test@example.com', 'Focus', 'Ford', 'MOT', ?, ?, 'MK58DA', 'Luton', 'PENDING')
+        """, rows)
+        return [row["id"] for row in db.execute("SELECT id FROM bookings ORDER BY date DESC, booking_time DESC, id DESC")]
+
+
+def walk(app, match, page_size):
+    """Page forward to the end, then back to the start. Returns both lists of pages."""
+    with app.app_context():
+        db = get_db()
+        forward, cursor = [], None
+        while True:
+            rows, cursor, prev_cursor = fetch_bookings_page(db, match, [], [], page_size, after=cursor)
+            forward.append([row["id"] for row in rows])
+            if not cursor:
+                break
+
+        backward, cursor = [], prev_cursor
+        while cursor:
+            rows, _, cursor = fetch_bookings_page(db, match, [], [], page_size, before=cursor)
+            backward.append([row["id"] for row in rows])
+    return forward, backward[::-1]
+
+
+@pytest.mark.parametrize("page_size", [1, 4, 23, 50])
+def test_walking_pages_visits_every_booking_once(app, bookings, page_size):
+    forward, backward = walk(app, "", page_size)
+
+    assert [booking_id for page in forward for booking_id in page] == bookings
+    assert all(len(page) == page_size for page in forward[:-1])
+    assert backward == forward[:-1]
+
+
+def test_walking_search_results_with_equal_rank(app, bookings):
+    forward, backward = walk(app, search_match_expression("test customer"), 5)
+
+    ids = [booking_id for page in forward for booking_id in page]
+    assert sorted(ids) == sorted(bookings)   # every row ties on rank, so id alone orders them
+    assert ids == sorted(ids)
+    assert backward == forward[:-1]
+
+
+@pytest.mark.parametrize("cursor", ["nonsense", "x|y|z", "2024-01-01|09:00|not-an-id", ""])
+def test_garbage_cursor_shows_the_first_page(app, bookings, cursor):
+    with app.app_context():
+        rows, next_cursor, prev_cursor = fetch_bookings_page(get_db(), "", [], [], 5, after=cursor)
+
+    assert [row["id"] for row in rows] == bookings[:5]
+    assert prev_cursor is None
+    assert next_cursor is not None
+
+
+def test_dashboard_pagination_labels(admin_client, bookings):
+    page = admin_client.get("/admin/dashboard?per_page=5").get_data(as_text=True)
+
+    assert "Previous" in page and "Next" in page
+    assert "Newer" not in page and "Older" not in page
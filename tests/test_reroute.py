@@ -0,0 +1,54 @@
+from app import get_db, transaction
+
+
+def add_booking(app, day, branch, chosen=False, status="PENDING"):
+    with app.app_context(), transaction() as db:
+        db.execute("""
+            INSERT INTO bookings (name, email, vehicle, make, service, date, booking_time, postcode, branch,
+                                  branch_chosen, status)
+            VALUES ('Test Customer', 'test@example.com', 'Focus', 'Ford', 'MOT', ?, '10:00', 'MK58DA', ?, ?, ?)
+        """, (day.isoformat(), branch, chosen, status))
+
+
+def occupancy(app, day):
+    with app.app_context():
+        return dict(get_db().execute(
+            "SELECT branch, booked FROM slot_occupancy WHERE date=? AND slot='10:00'", (day.isoformat(),)
+        ).fetchall())
+
+
+def reroute(app):
+    return app.test_cli_runner().invoke(args=["reroute-bookings"])
+
+
+def fill_slot(app, day):
+    """Every branch full at 10:00 with MK5 customers; one Wembley booking was picked by the customer."""
+    for _ in range(4):
+        add_booking(app, day, "Milton Keynes")
+    add_booking(app, day, "Wembley", chosen=True)
+    for _ in range(2):
+        add_booking(app, day, "Wembley")
+    for _ in range(2):
+        add_booking(app, day, "Luton")
+
+
+def test_reroute_never_overfills_a_slot(app, open_day):
+    fill_slot(app, open_day)
+
+    result = reroute(app)
+
+    assert result.exit_code == 0
+    assert occupancy(app, open_day) == {"Milton Keynes": 4, "Wembley": 3, "Luton": 2}
+
+
+def test_reroute_fills_freed_bays_but_leaves_chosen_branches(app, open_day):
+    fill_slot(app, open_day)
+    with app.app_context(), transaction() as db:
+        db.execute("UPDATE bookings SET status='CANCELLED' WHERE branch='Milton Keynes' AND id <= 3")
+
+    reroute(app)
+
+    assert occupancy(app, open_day) == {"Milton Keynes": 4, "Wembley": 1, "Luton": 1}
+    with app.app_context():
+        chosen = get_db().execute("SELECT branch FROM bookings WHERE branch_chosen").fetchall()
+    assert [row["branch"] for row in chosen] == ["Wembley"]
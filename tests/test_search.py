@@ -0,0 +1,80 @@
+from app import (booking_filters, drain_branch_jobs, enqueue_branch_jobs, fetch_bookings_page, get_db,
+                 search_match_expression, transaction)
+
+
+def add_booking(app, day, name, make="Ford", branch="Milton Keynes", status="PENDING", postcode="MK58DA"):
+    with app.app_context(), transaction() as db:
+        return db.execute("""
+            INSERT INTO bookings (name, email, vehicle, make, service, date, booking_time, postcode, branch, status)
+            VALUES (?, 'test@example.com', 'Focus', ?, 'MOT', ?, '10:00', ?, ?, ?)
+        """, (name, make, day.isoformat(), postcode, branch, status)).lastrowid
+
+
+def search(app, text, status="ALL", branch="ALL"):
+    with app.app_context():
+        clauses, params = booking_filters(status, branch)
+        rows, _, _ = fetch_bookings_page(get_db(), search_match_expression(text), clauses, params, 100)
+    return {row["id"] for row in rows}
+
+
+def assert_index_in_sync(app):
+    with app.app_context():
+        # Raises "database disk image is malformed" if the index and table differ.
+        get_db().execute("INSERT INTO bookings_fts (bookings_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_index_follows_updates_and_deletes(app, admin_client, open_day):
+    alice = add_booking(app, open_day, "Alice Archer")
+    bob = add_booking(app, open_day, "Bob Baker")
+
+    with app.app_context(), transaction() as db:
+        db.execute("UPDATE bookings SET name='Alice Smith', make='Vauxhall' WHERE id=?", (alice,))
+    admin_client.post(f"/admin/delete/{bob}")
+
+    assert search(app, "archer") == set()
+    assert search(app, "smith vauxhall") == {alice}
+    assert search(app, "baker") == set()
+    assert_index_in_sync(app)
+
+
+def test_index_follows_background_branch_assignment(app, open_day):
+    booking_id = add_booking(app, open_day, "Carol Cole", branch="ASSIGNING", postcode="HA90WS")
+    with app.app_context():
+        with transaction() as db:
+            enqueue_branch_jobs(db, [booking_id])
+        drain_branch_jobs(get_db())
+
+    assert search(app, "assigning") == set()
+    assert search(app, "carol wembley") == {booking_id}
+    assert_index_in_sync(app)
+
+
+def test_last_word_matches_as_a_prefix(app, open_day):
+    dave = add_booking(app, open_day, "Dave Dawson")
+    add_booking(app, open_day, "Davina Jones")
+
+    assert search(app, "daws") == {dave}
+    assert search(app, "dave daw") == {dave}
+    assert search(app, "daw dave") == set()   # only the last word is a prefix
+
+
+def test_filters_narrow_search_results(app, open_day):
+    pending = add_booking(app, open_day, "Eve Evans")
+    completed = add_booking(app, open_day, "Eve Ellis", status="COMPLETED")
+    at_luton = add_booking(app, open_day, "Eve Edwards", branch="Luton")
+
+    assert search(app, "eve") == {pending, completed, at_luton}
+    assert search(app, "eve", status="COMPLETED") == {completed}
+    assert search(app, "eve", branch="Luton") == {at_luton}
+    assert search(app, "eve", status="COMPLETED", branch="Luton") == set()
+
+
+def test_punctuation_only_search_shows_everything(app, admin_client, open_day):
+    ids = {add_booking(app, open_day, name) for name in ("Fay Ford", "Gus Grant")}
+
+    assert search_match_expression("'\"*-() ") == ""
+    assert search(app, "'\"*-() ") == ids
+    response = admin_client.get("/admin/dashboard", query_string={"search": '"*-('})
+    assert response.status_code == 200
+    assert "Fay Ford" in response.get_data(as_text=True)
+    assert "Gus Grant" in response.get_data(as_text=True)